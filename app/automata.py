@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List
+
+import ahocorasick
+
+# --- Automaton Cache Settings ---
+# Compiled Aho-Corasick automata are kept in a bounded LRU, keyed by the keyword list's digest.
+# Registered keyword sets are also pickled to disk so they survive restarts; ad-hoc keyword
+# lists from requests only live in memory, so callers can't grow the directory without bound.
+AUTOMATON_CACHE_SIZE = int(os.getenv("AUTOMATON_CACHE_SIZE", "32"))
+AUTOMATON_CACHE_DIR = os.getenv("AUTOMATON_CACHE_DIR", "./.automaton_cache")  # Empty disables persistence
+# -------------------------------------
+
+_lock = threading.Lock()
+_automata: "OrderedDict[str, ahocorasick.Automaton]" = OrderedDict()
+
+def normalize_keywords(keywords: Iterable[str]) -> List[str]:
+    """Returns the sorted, de-duplicated, non-empty keywords."""
+    return sorted({keyword for keyword in keywords if keyword})
+
+def keyword_digest(keywords: Iterable[str]) -> str:
+    """Identifies a keyword list by the SHA-256 of its sorted, de-duplicated form."""
+    return hashlib.sha256(json.dumps(normalize_keywords(keywords)).encode("utf-8")).hexdigest()
+
+def fold_case(text: str) -> str:
+    """
+    Lowercases text for case-insensitive matching without changing its length,
+    so match offsets still line up with the original text.
+    """
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded
+    # A few characters (e.g. 'İ') lowercase to more than one character; keep those as-is
+    return "".join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+def build_automaton(keywords: Iterable[str], case_insensitive: bool = False) -> ahocorasick.Automaton:
+    """
+    Compiles an Aho-Corasick automaton whose values are the matched keywords.
+    A case-insensitive automaton matches case-folded text; its values are tuples of every
+    original keyword folding to the same key (e.g. "Invoice" and "invoice"), so each is reported.
+    """
+    A = ahocorasick.Automaton()
+    if not case_insensitive:
+        for keyword in normalize_keywords(keywords):
+            A.add_word(keyword, keyword)
+    else:
+        folded: Dict[str, List[str]] = {}
+        for keyword in normalize_keywords(keywords):
+            folded.setdefault(fold_case(keyword), []).append(keyword)
+        for key, originals in folded.items():
+            A.add_word(key, tuple(originals))
+    A.make_automaton()
+    return A
+
+def _path(digest: str) -> str:
+    return os.path.join(AUTOMATON_CACHE_DIR, f"{digest}.pkl")
+
+def _load(digest: str):
+    try:
+        with open(_path(digest), "rb") as f:
+            return pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+
+def _store(digest: str, A: ahocorasick.Automaton):
+    os.makedirs(AUTOMATON_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{_path(digest)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(A, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, _path(digest))
+
+def _remember(digest: str, A: ahocorasick.Automaton):
+    with _lock:
+        _automata[digest] = A
+        _automata.move_to_end(digest)
+        while len(_automata) > AUTOMATON_CACHE_SIZE:
+            _automata.popitem(last=False)
+
+def get_automaton(digest: str, load_keywords: Callable[[], Iterable[str]], case_insensitive: bool = False,
+                  persist: bool = True) -> ahocorasick.Automaton:
+    """
+    Returns the compiled automaton for a keyword digest, from memory, then disk,
+    and only compiles it (calling load_keywords) when neither has it.
+    With persist=False the disk cache is skipped entirely.
+    """
+    if case_insensitive:
+        # Not "-ci": automata pickled before values became keyword tuples must not be reused
+        digest = f"{digest}-fold"
+    with _lock:
+        A = _automata.get(digest)
+        if A is not None:
+            _automata.move_to_end(digest)
+            return A
+    persist = persist and bool(AUTOMATON_CACHE_DIR)
+    A = _load(digest) if persist else None
+    if A is None:
+        A = build_automaton(load_keywords(), case_insensitive)
+        if persist:
+            _store(digest, A)
+    _remember(digest, A)
+    return A
+
+def automaton_for(keywords: List[str], case_insensitive: bool = False) -> ahocorasick.Automaton:
+    """Returns the cached automaton for an ad-hoc keyword list (memory only)."""
+    return get_automaton(keyword_digest(keywords), lambda: keywords, case_insensitive, persist=False)
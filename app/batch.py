@@ -0,0 +1,96 @@
+import os
+import time
+import zipfile
+from typing import AsyncIterator, Callable, List, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+
+from . import dispatch
+
+# --- Batch Extraction Settings ---
+# Maximum number of PDFs in one batch, counting the PDFs inside ZIP archives
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "100"))
+# -------------------------------------
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+# A batch document is (filename, pdf_bytes)
+Document = Tuple[str, bytes]
+
+def _too_large(limit_bytes: int, tier: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Batch size exceeds the {limit_bytes // (1024 * 1024)}MB limit for the {tier} tier."
+    )
+
+def _is_zip(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+def _zip_members(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir() and info.filename.lower().endswith(".pdf") and not info.filename.startswith("__MACOSX/")
+    ]
+
+def read_documents(files: List[UploadFile], limit_bytes: int, tier: str) -> List[Document]:
+    """
+    Reads the PDFs of a batch upload: plain PDF uploads plus the PDFs inside ZIP archives.
+    The tier limit applies to the total size, counting archive members uncompressed.
+    Blocking; run it off the event loop.
+    """
+    documents: List[Document] = []
+    total = 0
+    for file in files:
+        if _is_zip(file):
+            try:
+                archive = zipfile.ZipFile(file.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"'{file.filename}' is not a valid ZIP archive.")
+            with archive:
+                for info in _zip_members(archive):
+                    # Check the declared size first, then read no more than the remaining allowance
+                    if total + info.file_size > limit_bytes:
+                        raise _too_large(limit_bytes, tier)
+                    with archive.open(info) as member:
+                        data = member.read(limit_bytes - total + 1)
+                    total += len(data)
+                    if total > limit_bytes:
+                        raise _too_large(limit_bytes, tier)
+                    documents.append((info.filename, data))
+        elif file.content_type == "application/pdf":
+            data = file.file.read(limit_bytes - total + 1)
+            total += len(data)
+            if total > limit_bytes:
+                raise _too_large(limit_bytes, tier)
+            documents.append((file.filename, data))
+        else:
+            raise HTTPException(status_code=400, detail=f"Invalid file type for '{file.filename}'. Upload PDFs or ZIP archives of PDFs.")
+        if len(documents) > BATCH_MAX_DOCUMENTS:
+            raise HTTPException(status_code=400, detail=f"A batch may contain at most {BATCH_MAX_DOCUMENTS} documents.")
+    if not documents:
+        raise HTTPException(status_code=400, detail="The batch contains no PDF documents.")
+    return documents
+
+def document_records(documents: List[Document], extract: Callable[[bytes], List[str]]) -> AsyncIterator[dict]:
+    """
+    Extracts the documents concurrently on the "extract" pool and yields one record per
+    document as soon as it finishes, followed by a summary record. A document that
+    fails to extract gets an error record; the rest of the batch carries on.
+    """
+    results = dispatch.map_unordered("extract", lambda document: extract(document[1]), documents)
+
+    async def records() -> AsyncIterator[dict]:
+        started = time.perf_counter()
+        failed = 0
+        async for index, pages in results:
+            filename = documents[index][0]
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+            if isinstance(pages, Exception):
+                failed += 1
+                yield {"document": index, "filename": filename, "error": f"Error processing PDF file: {pages}", "elapsed_ms": elapsed_ms}
+            else:
+                yield {"document": index, "filename": filename, "pages": len(pages), "text": "".join(pages), "elapsed_ms": elapsed_ms}
+        yield {"done": True, "documents": len(documents), "failed": failed,
+               "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    return records()
@@ -0,0 +1,220 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+# --- Result Cache Settings ---
+# Extraction/OCR results are cached by the SHA-256 of the uploaded document plus mode and options.
+RESULT_CACHE_MEMORY_BYTES = int(os.getenv("RESULT_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))  # 64 MB
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "./.result_cache")  # Empty disables the disk tier
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(1024 * 1024 * 1024)))  # 1 GB
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 60 * 60)))  # 1 day
+# -------------------------------------
+
+def document_hash(data: bytes) -> str:
+    """Returns the SHA-256 hex digest identifying a document's contents."""
+    return hashlib.sha256(data).hexdigest()
+
+def result_key(doc_hash: str, mode: str, options: Optional[dict] = None) -> str:
+    """Builds the cache key for a document processed in a given mode with given options."""
+    descriptor = json.dumps({"doc": doc_hash, "mode": mode, "options": options or {}}, sort_keys=True)
+    return hashlib.sha256(descriptor.encode("utf-8")).hexdigest()
+
+def _size_of(pages: List) -> int:
+    # A page is its text, or a dict holding its text alongside other fields; sizes are UTF-8 bytes
+    return sum(len((page["text"] if isinstance(page, dict) else page).encode("utf-8")) for page in pages)
+
+class ResultCache:
+    """
+    Two-tier cache of per-page results: an in-memory LRU bounded by size, backed by
+    an on-disk tier with size-based eviction. Both tiers expire entries after a TTL.
+    """
+    def __init__(self, memory_bytes: int, disk_dir: str, disk_bytes: int, ttl_seconds: int):
+        self.memory_bytes = memory_bytes
+        self.disk_dir = disk_dir
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, pages, size)
+        self._memory_used = 0
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()  # key -> file size, oldest first
+        self._disk_used = 0
+        self.counters: Dict[str, int] = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0,
+            "memory_evictions": 0, "disk_evictions": 0, "expirations": 0,
+        }
+        if self.disk_dir:
+            self._load_disk_index()
+
+    # --- Memory tier ---
+
+    def _memory_put(self, key: str, expires_at: float, pages: List):
+        size = _size_of(pages)
+        if size > self.memory_bytes:
+            return
+        if key in self._memory:
+            self._memory_used -= self._memory.pop(key)[2]
+        self._memory[key] = (expires_at, pages, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_used -= evicted_size
+            self.counters["memory_evictions"] += 1
+
+    def _memory_get(self, key: str) -> Optional[List]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, pages, size = entry
+        if expires_at < time.time():
+            del self._memory[key]
+            self._memory_used -= size
+            self.counters["expirations"] += 1
+            return None
+        self._memory.move_to_end(key)
+        return pages
+
+    # --- Disk tier ---
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_used += size
+
+    def _disk_forget(self, keys: Iterable[str]) -> List[str]:
+        # Called with the lock held; returns the files to delete once it is released
+        paths = []
+        for key in keys:
+            self._disk_used -= self._disk_index.pop(key, 0)
+            paths.append(self._path(key))
+        return paths
+
+    @staticmethod
+    def _unlink(paths: Iterable[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _disk_write(self, key: str, expires_at: float, pages: List) -> int:
+        """Serializes and writes an entry without holding the lock. Returns its size on disk."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"expires_at": expires_at, "pages": pages}).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _disk_index_put(self, key: str, size: int) -> List[str]:
+        # Called with the lock held; returns the evicted files to delete
+        if key in self._disk_index:
+            self._disk_used -= self._disk_index.pop(key)
+        self._disk_index[key] = size
+        self._disk_used += size
+        evicted = []
+        while self._disk_used > self.disk_bytes and self._disk_index:
+            oldest, oldest_size = self._disk_index.popitem(last=False)
+            self._disk_used -= oldest_size
+            evicted.append(self._path(oldest))
+            self.counters["disk_evictions"] += 1
+        return evicted
+
+    def _disk_read(self, key: str) -> Optional[dict]:
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    # --- Public API ---
+    # Disk reads, writes and deletes happen outside the lock, which only guards the
+    # memory tier, the disk index and the counters.
+
+    def get(self, key: str) -> Optional[List]:
+        """Returns the cached pages for a key, or None on a miss."""
+        with self._lock:
+            pages = self._memory_get(key)
+            if pages is not None:
+                self.counters["memory_hits"] += 1
+                return pages
+        entry = self._disk_read(key) if self.disk_dir else None
+        stale: List[str] = []
+        with self._lock:
+            if entry is not None and entry["expires_at"] < time.time():
+                stale = self._disk_forget([key])
+                self.counters["expirations"] += 1
+                entry = None
+            if entry is None:
+                if self.disk_dir and not stale:
+                    # Unreadable or already deleted; stop counting it
+                    self._disk_forget([key])
+                self.counters["misses"] += 1
+            else:
+                self.counters["disk_hits"] += 1
+                if key in self._disk_index:
+                    self._disk_index.move_to_end(key)
+                # Promote to the memory tier for the next lookup
+                self._memory_put(key, entry["expires_at"], entry["pages"])
+        self._unlink(stale)
+        return entry["pages"] if entry is not None else None
+
+    def put(self, key: str, pages: List):
+        """Stores pages in both tiers."""
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._memory_put(key, expires_at, pages)
+        if not self.disk_dir:
+            return
+        size = self._disk_write(key, expires_at, pages)
+        with self._lock:
+            evicted = self._disk_index_put(key, size)
+        self._unlink(evicted)
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters and current tier sizes."""
+        with self._lock:
+            return {
+                **self.counters,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "memory_limit_bytes": self.memory_bytes,
+                "disk_items": len(self._disk_index),
+                "disk_bytes": self._disk_used,
+                "disk_limit_bytes": self.disk_bytes if self.disk_dir else 0,
+            }
+
+result_cache = ResultCache(
+    RESULT_CACHE_MEMORY_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_BYTES, RESULT_CACHE_TTL_SECONDS
+)
+
+def cached_pages(pdf_bytes: bytes, mode: str, produce: Callable[[], Iterable], options: Optional[dict] = None) -> List:
+    """Returns a document's pages from the cache, or produces and caches them."""
+    key = result_key(document_hash(pdf_bytes), mode, options)
+    pages = result_cache.get(key)
+    if pages is None:
+        pages = list(produce())
+        result_cache.put(key, pages)
+    return pages
+
+def iter_cached_pages(pdf_bytes: bytes, mode: str, produce: Callable[[], Iterable], options: Optional[dict] = None) -> Iterator:
+    """
+    Yields a document's pages from the cache if present, otherwise straight from the producer.
+    Streamed results are not stored, so memory stays at one page per request.
+    """
+    pages = result_cache.get(result_key(document_hash(pdf_bytes), mode, options))
+    yield from pages if pages is not None else produce()
@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from . import schemas
+
+# --- Auth Cache Settings ---
+# Authenticated client records are cached in-process so protected endpoints skip the DB.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))  # 5 minutes
+# -------------------------------------
+
+class ClientCache:
+    """
+    A bounded, thread-safe LRU of client records keyed by client_id, with a TTL so
+    changes made by other processes are picked up eventually.
+    """
+    def __init__(self, size: int, ttl_seconds: int):
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._clients: "OrderedDict[str, tuple]" = OrderedDict()  # client_id -> (expires_at, client)
+
+    def get(self, client_id: str) -> Optional[schemas.AuthenticatedClient]:
+        """Returns the cached client, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._clients.get(client_id)
+            if entry is None:
+                return None
+            expires_at, client = entry
+            if expires_at < time.monotonic():
+                del self._clients[client_id]
+                return None
+            self._clients.move_to_end(client_id)
+            return client
+
+    def put(self, client: schemas.AuthenticatedClient):
+        with self._lock:
+            self._clients[client.client_id] = (time.monotonic() + self.ttl_seconds, client)
+            self._clients.move_to_end(client.client_id)
+            while len(self._clients) > self.size:
+                self._clients.popitem(last=False)
+
+    def invalidate(self, client_id: str):
+        """Drops a client's record, e.g. after its tier changed."""
+        with self._lock:
+            self._clients.pop(client_id, None)
+
+client_cache = ClientCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
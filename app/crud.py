@@ -1,33 +1,73 @@
+from sqlalchemy import bindparam, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import bcrypt
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta, timezone
+from typing import Union
 import secrets
-from . import models, schemas
+import uuid
+import json
+from . import database, models, schemas
+from .client_cache import client_cache
+
+# Client lookups run on every cache miss in auth, so their statements are built once;
+# SQLAlchemy reuses the compiled SQL and asyncpg its prepared statement per connection.
+CLIENT_BY_ID = select(models.Client).where(models.Client.client_id == bindparam("client_id")).limit(1)
+CLIENT_BY_NAME = select(models.Client).where(models.Client.client_name == bindparam("client_name")).limit(1)
+
+# The *_async client functions take an AsyncSession, or a sync Session when the async
+# engine is unavailable (see database.get_async_db), which they run on the threadpool.
+AnySession = Union[AsyncSession, Session]
 
 def get_client_by_name(db: Session, client_name: str):
     """Looks up a client by its name."""
-    return db.query(models.Client).filter(models.Client.client_name == client_name).first()
+    return db.execute(CLIENT_BY_NAME, {"client_name": client_name}).scalars().first()
+
+async def get_client_by_name_async(db: AnySession, client_name: str):
+    if not isinstance(db, AsyncSession):
+        return await run_in_threadpool(get_client_by_name, db, client_name)
+    return (await db.execute(CLIENT_BY_NAME, {"client_name": client_name})).scalars().first()
 
 def get_client_by_id(db: Session, client_id: str):
     """Looks up a client by its ID."""
-    return db.query(models.Client).filter(models.Client.client_id == client_id).first()
-
-def create_client(db: Session, client: schemas.ClientCreate):
-    """Creates a new client application, returning the DB object and the plain secret."""
-    client_id = secrets.token_urlsafe(16)
-    plain_secret = secrets.token_urlsafe(32)
-    hashed_secret = bcrypt.hashpw(plain_secret.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
-    db_client = models.Client(
-        client_id=client_id,
+    return db.execute(CLIENT_BY_ID, {"client_id": client_id}).scalars().first()
+
+async def get_client_by_id_async(db: AnySession, client_id: str):
+    if not isinstance(db, AsyncSession):
+        return await run_in_threadpool(get_client_by_id, db, client_id)
+    return (await db.execute(CLIENT_BY_ID, {"client_id": client_id})).scalars().first()
+
+async def release_connection(db: AnySession):
+    """Ends the session's read-only transaction so its connection goes back to the pool."""
+    if not isinstance(db, AsyncSession):
+        return await database.release_in_thread(db.rollback)
+    await db.rollback()
+
+def _new_client(client: schemas.ClientCreate, hashed_secret: str) -> models.Client:
+    return models.Client(
+        client_id=secrets.token_urlsafe(16),
         client_secret_hash=hashed_secret,
         client_name=client.client_name,
         email=client.email,
         redirect_uri=client.redirect_uri
     )
+
+def create_client(db: Session, client: schemas.ClientCreate, hashed_secret: str):
+    """Creates a new client application with an already-hashed secret."""
+    db_client = _new_client(client, hashed_secret)
     db.add(db_client)
     db.commit()
     db.refresh(db_client)
-    return db_client, plain_secret
+    return db_client
+
+async def create_client_async(db: AnySession, client: schemas.ClientCreate, hashed_secret: str):
+    if not isinstance(db, AsyncSession):
+        return await run_in_threadpool(create_client, db, client, hashed_secret)
+    db_client = _new_client(client, hashed_secret)
+    db.add(db_client)
+    await db.commit()
+    await db.refresh(db_client)
+    return db_client
 
 def upgrade_client_tier(db: Session, client_id: str):
     """Upgrades a client's tier to 'exclusive'."""
@@ -36,13 +76,189 @@ def upgrade_client_tier(db: Session, client_id: str):
         db_client.tier = "exclusive"
         db.commit()
         db.refresh(db_client)
+        client_cache.invalidate(client_id)
+    return db_client
+
+async def upgrade_client_tier_async(db: AnySession, client_id: str):
+    if not isinstance(db, AsyncSession):
+        return await run_in_threadpool(upgrade_client_tier, db, client_id)
+    db_client = await get_client_by_id_async(db, client_id)
+    if db_client:
+        db_client.tier = "exclusive"
+        await db.commit()
+        await db.refresh(db_client)
+        client_cache.invalidate(client_id)
     return db_client
 
-def authenticate_client(db: Session, client_id: str, client_secret: str):
-    """Authenticates a client by checking its ID and secret."""
-    client = get_client_by_id(db, client_id=client_id)
-    if not client:
-        return None
-    if not bcrypt.checkpw(client_secret.encode('utf-8'), client.client_secret_hash.encode('utf-8')):
-        return None
-    return client
\ No newline at end of file
+# --- OCR Job Queue ---
+
+def create_ocr_job(db: Session, client_id: str, filename: str, payload: bytes, options: dict):
+    """Queues a new OCR job for a client."""
+    db_job = models.OcrJob(
+        id=uuid.uuid4().hex, client_id=client_id, filename=filename, payload=payload, options=json.dumps(options)
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_ocr_job(db: Session, job_id: str, client_id: str):
+    """Looks up a job by its ID, only if it belongs to the given client."""
+    return db.query(models.OcrJob).filter(
+        models.OcrJob.id == job_id, models.OcrJob.client_id == client_id
+    ).first()
+
+def count_active_ocr_jobs(db: Session, client_id: str):
+    """Counts a client's jobs that are still queued or running."""
+    return db.query(models.OcrJob).filter(
+        models.OcrJob.client_id == client_id, models.OcrJob.status.in_(("queued", "running"))
+    ).count()
+
+def requeue_stale_ocr_jobs(db: Session, stale_after: timedelta):
+    """Puts 'running' jobs back on the queue if their worker stopped reporting progress."""
+    cutoff = datetime.now(timezone.utc) - stale_after
+    count = db.query(models.OcrJob).filter(
+        models.OcrJob.status == "running", models.OcrJob.updated_at < cutoff
+    ).update({"status": "queued", "pages_done": 0}, synchronize_session=False)
+    db.commit()
+    return count
+
+def claim_next_ocr_job(db: Session):
+    """
+    Atomically moves the oldest queued job to 'running' and returns it.
+    The conditional UPDATE makes this safe with several workers on SQLite or Postgres.
+    """
+    while True:
+        job_id = db.query(models.OcrJob.id).filter(
+            models.OcrJob.status == "queued"
+        ).order_by(models.OcrJob.created_at).limit(1).scalar()
+        if job_id is None:
+            return None
+        claimed = db.query(models.OcrJob).filter(
+            models.OcrJob.id == job_id, models.OcrJob.status == "queued"
+        ).update({"status": "running", "updated_at": datetime.now(timezone.utc)}, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.get(models.OcrJob, job_id)
+
+def update_ocr_job_progress(db: Session, db_job: models.OcrJob, pages_done: int, pages_total: int):
+    """Records how many pages of a running job are finished."""
+    db_job.pages_done = pages_done
+    db_job.pages_total = pages_total
+    db.commit()
+
+def finish_ocr_job(db: Session, db_job: models.OcrJob, result_text: str):
+    """Stores a job's result and drops its payload."""
+    db_job.status = "done"
+    db_job.result_text = result_text
+    db_job.payload = None
+    db.commit()
+
+def fail_ocr_job(db: Session, db_job: models.OcrJob, error: str):
+    """Marks a job as failed and drops its payload."""
+    db_job.status = "failed"
+    db_job.error = error
+    db_job.payload = None
+    db.commit()
+
+# --- Keyword Sets ---
+
+def create_keyword_set(db: Session, client_id: str, name: str, keywords: list, digest: str):
+    """Registers a named keyword set for a client."""
+    db_set = models.KeywordSet(
+        id=uuid.uuid4().hex, client_id=client_id, name=name, digest=digest,
+        keyword_count=len(keywords), keywords=json.dumps(keywords)
+    )
+    db.add(db_set)
+    db.commit()
+    db.refresh(db_set)
+    return db_set
+
+def get_keyword_set(db: Session, keyword_set_id: str, client_id: str):
+    """Looks up a keyword set by its ID, only if it belongs to the given client."""
+    return db.query(models.KeywordSet).filter(
+        models.KeywordSet.id == keyword_set_id, models.KeywordSet.client_id == client_id
+    ).first()
+
+def get_keyword_sets(db: Session, client_id: str):
+    """Lists a client's keyword sets."""
+    return db.query(models.KeywordSet).filter(
+        models.KeywordSet.client_id == client_id
+    ).order_by(models.KeywordSet.created_at).all()
+
+def get_keyword_set_keywords(db: Session, keyword_set_id: str):
+    """Loads the keyword list of a keyword set."""
+    db_set = db.get(models.KeywordSet, keyword_set_id)
+    return json.loads(db_set.keywords)
+
+def delete_keyword_set(db: Session, db_set: models.KeywordSet):
+    """Removes a keyword set."""
+    db.delete(db_set)
+    db.commit()
+
+# --- Document Store ---
+
+def create_document(db: Session, client_id: str, filename: str, sha256: str, method: str, pages: list):
+    """Stores a document's extracted per-page text for later searches."""
+    db_document = models.Document(
+        id=uuid.uuid4().hex, client_id=client_id, filename=filename, sha256=sha256,
+        method=method, page_count=len(pages)
+    )
+    db.add(db_document)
+    db.add_all([
+        models.DocumentPage(document_id=db_document.id, client_id=client_id, page_number=number, text=text)
+        for number, text in enumerate(pages, start=1)
+    ])
+    db.commit()
+    db.refresh(db_document)
+    return db_document
+
+def get_document(db: Session, document_id: str, client_id: str):
+    """Looks up a document by its ID, only if it belongs to the given client."""
+    return db.query(models.Document).filter(
+        models.Document.id == document_id, models.Document.client_id == client_id
+    ).first()
+
+def get_documents(db: Session, client_id: str, limit: int, offset: int):
+    """Lists a client's stored documents, newest first."""
+    return db.query(models.Document).filter(
+        models.Document.client_id == client_id
+    ).order_by(models.Document.created_at.desc()).offset(offset).limit(limit).all()
+
+def delete_document(db: Session, db_document: models.Document):
+    """Removes a stored document and its pages."""
+    db.query(models.DocumentPage).filter(
+        models.DocumentPage.document_id == db_document.id
+    ).delete(synchronize_session=False)
+    db.delete(db_document)
+    db.commit()
+
+# --- Usage Metering ---
+
+USAGE_FIELDS = ("requests", "bytes_uploaded", "pages", "ocr_seconds", "detect_calls")
+
+def add_usage(db: Session, client_id: str, bucket_start: datetime, counts: dict):
+    """
+    Adds counts to a client's usage bucket: an UPDATE that increments the existing row,
+    or an INSERT if there is none yet. Does not commit, so many buckets can share a transaction.
+    """
+    updated = db.query(models.UsageRecord).filter(
+        models.UsageRecord.client_id == client_id, models.UsageRecord.bucket_start == bucket_start
+    ).update(
+        {getattr(models.UsageRecord, field): getattr(models.UsageRecord, field) + counts.get(field, 0) for field in USAGE_FIELDS},
+        synchronize_session=False
+    )
+    if not updated:
+        with db.begin_nested():
+            db.add(models.UsageRecord(
+                client_id=client_id, bucket_start=bucket_start,
+                **{field: counts.get(field, 0) for field in USAGE_FIELDS}
+            ))
+
+def get_usage(db: Session, client_id: str, start: datetime, end: datetime):
+    """Returns a client's usage buckets starting in [start, end), oldest first."""
+    return db.query(models.UsageRecord).filter(
+        models.UsageRecord.client_id == client_id,
+        models.UsageRecord.bucket_start >= start,
+        models.UsageRecord.bucket_start < end
+    ).order_by(models.UsageRecord.bucket_start).all()
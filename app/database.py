@@ -1,18 +1,103 @@
+import logging
 import os
+import anyio
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
-engine = create_engine(DATABASE_URL)
+# --- Connection Pool Settings ---
+# Applied to both engines (SQLite keeps SQLAlchemy's default pools)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Check connections before use, and replace them after this many seconds
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))  # 30 minutes
+# The async engine serves the auth and client paths. Its URL is derived from DATABASE_URL
+# (asyncpg for PostgreSQL, aiosqlite for SQLite) unless set explicitly. When it is
+# disabled or its driver is missing, those paths use the sync engine on the threadpool.
+DB_ASYNC_ENABLED = os.getenv("DB_ASYNC_ENABLED", "true").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+# -------------------------------------
+
+logger = logging.getLogger(__name__)
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def _pool_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+    }
+
+def async_url(url: str) -> str:
+    """Returns DATABASE_URL with its driver swapped for the async one."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver known for '{parsed.get_backend_name()}' databases; set ASYNC_DATABASE_URL.")
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(hide_password=False)
+
+def _create_async_engine():
+    if not DB_ASYNC_ENABLED:
+        return None
+    try:
+        url = ASYNC_DATABASE_URL or async_url(DATABASE_URL)
+        return create_async_engine(url, **_pool_options(url))
+    except (ImportError, ValueError) as e:
+        logger.warning("Async database engine unavailable (%s); using the sync engine", e)
+        return None
+
+engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = _create_async_engine()
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False) if async_engine else None
+
 # Dependency to get a DB session for each request
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def release_in_thread(func):
+    """
+    Runs a blocking call that hands a sync connection back to the pool (rollback, close).
+    Like FastAPI's dependency exits it gets its own limiter: queueing for a threadpool
+    slot could deadlock behind requests that hold slots while waiting for a connection.
+    """
+    return await anyio.to_thread.run_sync(func, limiter=anyio.CapacityLimiter(1))
+
+async def get_async_db():
+    """
+    Dependency to get an AsyncSession for each request. When the async engine is
+    unavailable it opens a sync Session instead, which crud's async functions run on
+    the threadpool; the async path itself never leaves the event loop.
+    """
+    if AsyncSessionLocal is None:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await release_in_thread(db.close)
+        return
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def dispose_async_engine():
+    """Closes the async engine's pooled connections. Called when the application shuts down."""
+    if async_engine is not None:
+        await async_engine.dispose()
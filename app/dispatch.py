@@ -0,0 +1,199 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from fastapi import HTTPException, status
+
+# --- Work Pool Settings ---
+# Each pool runs blocking work (PyMuPDF, OCR, Aho-Corasick) off the event loop.
+# "concurrency" is how many jobs run at once, "queue" is how many may wait for a slot.
+POOL_SETTINGS = {
+    "extract": {
+        "concurrency": int(os.getenv("EXTRACT_CONCURRENCY", str(os.cpu_count() or 1))),
+        "queue": int(os.getenv("EXTRACT_QUEUE", "32")),
+    },
+    "ocr": {
+        "concurrency": int(os.getenv("OCR_CONCURRENCY", "2")),
+        "queue": int(os.getenv("OCR_QUEUE", "8")),
+    },
+    "search": {
+        "concurrency": int(os.getenv("SEARCH_CONCURRENCY", str(os.cpu_count() or 1))),
+        "queue": int(os.getenv("SEARCH_QUEUE", "32")),
+    },
+}
+RETRY_AFTER_SECONDS = int(os.getenv("DISPATCH_RETRY_AFTER_SECONDS", "5"))
+# How many items of one batch may hold or wait for pool slots at once, so other requests interleave
+BATCH_MAX_PARALLEL = int(os.getenv("BATCH_MAX_PARALLEL", "2"))
+# -------------------------------------
+
+class Admitted:
+    """
+    An async iterator holding one admitted place in a WorkPool. The place is given back
+    once, when the items run out or fail, on aclose(), on release(), or when the iterator
+    is dropped, so a response that never starts iterating doesn't keep it forever.
+    """
+    def __init__(self, pool: "WorkPool", items: AsyncIterator):
+        self._pool = pool
+        self._items = items
+        self._held = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._items.__anext__()
+        except BaseException:
+            self.release()
+            raise
+
+    async def aclose(self):
+        try:
+            await self._items.aclose()
+        finally:
+            self.release()
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._pool.release()
+
+    def __del__(self):
+        self.release()
+
+class WorkPool:
+    """
+    A bounded thread pool with admission control.
+    Requests beyond concurrency + queue are rejected immediately instead of piling up.
+    """
+    def __init__(self, name: str, concurrency: int, queue: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue = queue
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"{name}-pool")
+        self.admitted = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    def check(self):
+        """Raises 503 with Retry-After if the pool has no room for another job."""
+        if self.admitted >= self.concurrency + self.queue:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"The '{self.name}' service is busy. Please retry later.",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+
+    def admit(self):
+        """Reserves a place in the pool, or raises 503 with Retry-After if it is full."""
+        self.check()
+        self.admitted += 1
+
+    def release(self):
+        self.admitted -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Runs a blocking function on this pool once a slot is free and returns its result."""
+        self.admit()
+        try:
+            async with self.slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.executor, lambda: fn(*args, **kwargs))
+        finally:
+            self.release()
+
+    def stream(self, iterator: Iterator) -> Admitted:
+        """
+        Drains a blocking iterator on this pool, yielding items as they are produced.
+        The place in the pool is taken now, so a full pool is rejected with 503 before
+        the response starts, and held until the iterator is exhausted or closed.
+        """
+        self.admit()
+        return Admitted(self, self._drain(iterator))
+
+    async def _drain(self, iterator: Iterator) -> AsyncIterator:
+        try:
+            async with self.slots:
+                loop = asyncio.get_running_loop()
+                done = object()
+                while True:
+                    item = await loop.run_in_executor(self.executor, next, iterator, done)
+                    if item is done:
+                        break
+                    yield item
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except ValueError:
+                    # The generator is still running in the pool; it finishes on its own
+                    pass
+
+    def map_unordered(self, fn: Callable, items: Iterable) -> Admitted:
+        """
+        Runs fn on every item, yielding (index, result) as each one finishes. A failed
+        item yields its exception instead of a result. The whole batch takes a single
+        place in the queue, taken now like stream(), and at most BATCH_MAX_PARALLEL of
+        its items compete for the pool's slots at a time, so one batch can't queue ahead
+        of every other job.
+        """
+        self.admit()
+        return Admitted(self, self._map_unordered(fn, items))
+
+    async def _map_unordered(self, fn: Callable, items: Iterable) -> AsyncIterator[Tuple[int, object]]:
+        loop = asyncio.get_running_loop()
+        batch_slots = asyncio.Semaphore(max(1, min(self.concurrency, BATCH_MAX_PARALLEL)))
+
+        async def run_one(index: int, item):
+            async with batch_slots, self.slots:
+                try:
+                    return index, await loop.run_in_executor(self.executor, fn, item)
+                except Exception as e:
+                    return index, e
+
+        tasks = [asyncio.ensure_future(run_one(index, item)) for index, item in enumerate(items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Items still waiting for a slot are dropped if the consumer goes away
+            for task in tasks:
+                task.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+pools: Dict[str, WorkPool] = {
+    name: WorkPool(name, settings["concurrency"], settings["queue"])
+    for name, settings in POOL_SETTINGS.items()
+}
+
+async def run(pool: str, fn: Callable, *args, **kwargs):
+    """Runs blocking work on the named pool without blocking the event loop."""
+    return await pools[pool].run(fn, *args, **kwargs)
+
+def stream(pool: str, iterator: Iterator) -> Admitted:
+    """
+    Streams items from a blocking iterator run on the named pool.
+    Admission happens up front so a full pool is rejected before the response starts.
+    """
+    return pools[pool].stream(iterator)
+
+def map_unordered(pool: str, fn: Callable, items: Iterable) -> Admitted:
+    """
+    Runs fn on each item on the named pool, yielding (index, result or exception) in
+    completion order. Admission happens up front, like stream().
+    """
+    return pools[pool].map_unordered(fn, items)
+
+def shutdown():
+    """Stops all work pools. Called when the application shuts down."""
+    for pool in pools.values():
+        pool.shutdown()
@@ -0,0 +1,109 @@
+import logging
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Full-text index over document_pages.text: FTS5 on SQLite, a GIN expression index on
+# Postgres. Other databases fall back to a LIKE scan.
+
+_SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS document_pages_fts
+       USING fts5(text, content='document_pages', content_rowid='id')""",
+    """CREATE TRIGGER IF NOT EXISTS document_pages_fts_insert AFTER INSERT ON document_pages BEGIN
+           INSERT INTO document_pages_fts(rowid, text) VALUES (new.id, new.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS document_pages_fts_delete AFTER DELETE ON document_pages BEGIN
+           INSERT INTO document_pages_fts(document_pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS document_pages_fts_update AFTER UPDATE ON document_pages BEGIN
+           INSERT INTO document_pages_fts(document_pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+           INSERT INTO document_pages_fts(rowid, text) VALUES (new.id, new.text);
+       END""",
+]
+
+_POSTGRES_INDEX = [
+    """CREATE INDEX IF NOT EXISTS ix_document_pages_fts
+       ON document_pages USING GIN (to_tsvector('simple', text))""",
+]
+
+_SQLITE_SEARCH = """
+    SELECT p.document_id, d.filename, p.page_number,
+           snippet(document_pages_fts, 0, '[', ']', '...', 16) AS snippet
+    FROM document_pages_fts
+    JOIN document_pages p ON p.id = document_pages_fts.rowid
+    JOIN documents d ON d.id = p.document_id
+    WHERE document_pages_fts MATCH :query AND p.client_id = :client_id
+    ORDER BY bm25(document_pages_fts)
+    LIMIT :limit OFFSET :offset
+"""
+
+_POSTGRES_SEARCH = """
+    SELECT p.document_id, d.filename, p.page_number,
+           ts_headline('simple', p.text, q, 'StartSel=[, StopSel=], MaxFragments=1') AS snippet
+    FROM document_pages p
+    JOIN documents d ON d.id = p.document_id,
+         plainto_tsquery('simple', :query) q
+    WHERE to_tsvector('simple', p.text) @@ q AND p.client_id = :client_id
+    ORDER BY ts_rank(to_tsvector('simple', p.text), q) DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+def ensure_search_index(engine: Engine):
+    """Creates the full-text index for the engine's database if it does not exist yet."""
+    statements = {"sqlite": _SQLITE_INDEX, "postgresql": _POSTGRES_INDEX}.get(engine.dialect.name)
+    if not statements:
+        return
+    try:
+        with engine.begin() as conn:
+            for statement in statements:
+                conn.execute(text(statement))
+    except Exception:
+        logger.exception("Could not create the document full-text index; searches will scan pages")
+
+def _fts5_query(query: str) -> str:
+    # Quote each term so user input is never parsed as FTS5 syntax; terms are ANDed
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+def _like_search(db: Session, client_id: str, query: str, limit: int, offset: int) -> List[dict]:
+    page_query = db.query(
+        models.DocumentPage.document_id, models.Document.filename,
+        models.DocumentPage.page_number, models.DocumentPage.text
+    ).join(models.Document, models.Document.id == models.DocumentPage.document_id).filter(
+        models.DocumentPage.client_id == client_id
+    )
+    for term in query.split():
+        page_query = page_query.filter(models.DocumentPage.text.ilike(f"%{term}%"))
+    rows = page_query.order_by(models.DocumentPage.id).offset(offset).limit(limit).all()
+    return [
+        {"document_id": row.document_id, "filename": row.filename, "page": row.page_number, "snippet": row.text[:200]}
+        for row in rows
+    ]
+
+def _has_fts5_table(db: Session) -> bool:
+    return db.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'document_pages_fts'"
+    )).first() is not None
+
+def search_pages(db: Session, client_id: str, query: str, limit: int, offset: int) -> List[dict]:
+    """
+    Finds the client's stored pages containing all terms of the query, best matches first.
+    Returns document id, filename, page number and a highlighted snippet per page.
+    """
+    dialect = db.get_bind().dialect.name
+    params = {"client_id": client_id, "limit": limit, "offset": offset}
+    if dialect == "sqlite" and _has_fts5_table(db):
+        rows = db.execute(text(_SQLITE_SEARCH), {**params, "query": _fts5_query(query)}).all()
+    elif dialect == "postgresql":
+        rows = db.execute(text(_POSTGRES_SEARCH), {**params, "query": query}).all()
+    else:
+        return _like_search(db, client_id, query, limit, offset)
+    return [
+        {"document_id": row.document_id, "filename": row.filename, "page": row.page_number, "snippet": row.snippet}
+        for row in rows
+    ]
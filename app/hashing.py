@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import bcrypt
+
+from . import process_pool
+
+# --- Password Hashing Settings ---
+# bcrypt runs in its own worker processes so token storms don't tie up request threads.
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "0")) or os.cpu_count() or 1
+# Successful credential checks are remembered briefly so repeated logins skip bcrypt
+CREDENTIAL_CACHE_TTL_SECONDS = int(os.getenv("CREDENTIAL_CACHE_TTL_SECONDS", "300"))  # 5 minutes
+CREDENTIAL_CACHE_SIZE = int(os.getenv("CREDENTIAL_CACHE_SIZE", "10000"))
+# -------------------------------------
+
+_pool = process_pool.ProcessPool("bcrypt", BCRYPT_WORKERS)
+
+def get_pool() -> ProcessPoolExecutor:
+    """Returns the shared bcrypt process pool, creating it on first use or after it broke."""
+    return _pool.get()
+
+def shutdown_pool():
+    """Stops the bcrypt worker processes. Called when the application shuts down."""
+    _pool.shutdown()
+
+async def _run(fn, *args):
+    """Runs fn on the bcrypt pool; a broken pool fails this call and is replaced for the next."""
+    pool = get_pool()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        _pool.discard(pool)
+        raise
+
+# --- Worker process side ---
+
+@process_pool.portable_errors
+def _hashpw(secret: bytes) -> bytes:
+    return bcrypt.hashpw(secret, bcrypt.gensalt())
+
+@process_pool.portable_errors
+def _checkpw(secret: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(secret, hashed)
+
+# --- Verification cache ---
+# Entries are HMACs under a key that only lives in this process, so neither secrets
+# nor anything that could be brute-forced offline are ever kept. The stored hash is
+# part of the message, so a rotated secret never matches an old entry.
+_cache_key = secrets.token_bytes(32)
+_cache_lock = threading.Lock()
+_verified: "OrderedDict[bytes, float]" = OrderedDict()  # digest -> expires_at
+
+def _credential_digest(client_id: str, secret: str, stored_hash: str) -> bytes:
+    message = "\0".join((client_id, secret, stored_hash)).encode("utf-8")
+    return hmac.new(_cache_key, message, hashlib.sha256).digest()
+
+def _recently_verified(digest: bytes) -> bool:
+    with _cache_lock:
+        expires_at = _verified.get(digest)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del _verified[digest]
+            return False
+        return True
+
+def _remember(digest: bytes):
+    with _cache_lock:
+        _verified[digest] = time.monotonic() + CREDENTIAL_CACHE_TTL_SECONDS
+        _verified.move_to_end(digest)
+        while len(_verified) > CREDENTIAL_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+# --- Public API ---
+
+def new_secret() -> str:
+    """Generates a new client secret."""
+    return secrets.token_urlsafe(32)
+
+async def hash_secret(secret: str) -> str:
+    """Hashes a client secret with bcrypt on the worker pool."""
+    hashed = await _run(_hashpw, secret.encode("utf-8"))
+    return hashed.decode("utf-8")
+
+async def verify_secret(client_id: str, secret: str, stored_hash: str) -> bool:
+    """
+    Checks a client secret against its stored bcrypt hash on the worker pool.
+    Successful checks are cached for CREDENTIAL_CACHE_TTL_SECONDS; failures never are.
+    """
+    digest = _credential_digest(client_id, secret, stored_hash)
+    if _recently_verified(digest):
+        return True
+    valid = await _run(_checkpw, secret.encode("utf-8"), stored_hash.encode("utf-8"))
+    if valid:
+        _remember(digest)
+    return valid
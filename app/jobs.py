@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+from typing import List
+
+from . import cache, crud, database, metering, ocr
+
+# --- Job Worker Settings ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1.0"))
+# A running job with no progress for this long is assumed to have lost its worker
+JOB_STALE_AFTER_SECONDS = int(os.getenv("JOB_STALE_AFTER_SECONDS", "600"))
+# -------------------------------------
+
+logger = logging.getLogger(__name__)
+
+_stop = threading.Event()
+_workers: List[threading.Thread] = []
+
+def _process_job(db, db_job):
+    """OCRs a claimed job page by page, recording progress after each page."""
+    try:
+        pdf_bytes = db_job.payload
+        options = ocr.resolve_options(json.loads(db_job.options or "{}"))
+        cache_key = cache.result_key(cache.document_hash(pdf_bytes), "ocr", options)
+        page_texts = cache.result_cache.get(cache_key)
+        if page_texts is None:
+            page_numbers = list(ocr.page_range(ocr.count_pages(pdf_bytes), options))
+            pages_total = len(page_numbers)
+            crud.update_ocr_job_progress(db, db_job, 0, pages_total)
+            page_texts = []
+            meter_ocr = metering.ocr_seconds_recorder(db_job.client_id)
+            for page_text in ocr.iter_ocr_pages(pdf_bytes, page_numbers, options, meter_ocr):
+                page_texts.append(page_text)
+                crud.update_ocr_job_progress(db, db_job, len(page_texts), pages_total)
+            cache.result_cache.put(cache_key, page_texts)
+        else:
+            crud.update_ocr_job_progress(db, db_job, len(page_texts), len(page_texts))
+        crud.finish_ocr_job(db, db_job, "".join(page_text + "\n" for page_text in page_texts))
+    except Exception as e:
+        db.rollback()
+        if _stop.is_set():
+            # Shutting down: leave the job 'running' so it is requeued once it goes stale
+            return
+        logger.exception("OCR job %s failed", db_job.id)
+        crud.fail_ocr_job(db, db_job, f"Error during OCR processing: {e}")
+
+def _worker_loop():
+    while not _stop.is_set():
+        db = database.SessionLocal()
+        try:
+            crud.requeue_stale_ocr_jobs(db, timedelta(seconds=JOB_STALE_AFTER_SECONDS))
+            db_job = crud.claim_next_ocr_job(db)
+            if db_job is None:
+                _stop.wait(JOB_POLL_INTERVAL_SECONDS)
+                continue
+            _process_job(db, db_job)
+        except Exception:
+            logger.exception("OCR job worker error")
+            _stop.wait(JOB_POLL_INTERVAL_SECONDS)
+        finally:
+            db.close()
+
+def start_workers():
+    """Starts the background threads that process queued OCR jobs."""
+    _stop.clear()
+    for number in range(JOB_WORKERS):
+        worker = threading.Thread(target=_worker_loop, name=f"ocr-job-worker-{number}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+
+def stop_workers():
+    """Signals the job workers to stop and waits briefly for them to exit."""
+    _stop.set()
+    for worker in _workers:
+        worker.join(timeout=5)
+    _workers.clear()
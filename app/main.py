@@ -1,47 +1,83 @@
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, Request, status, File, UploadFile, Form, Query
+from fastapi.responses import PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-from datetime import timedelta
+from typing import Iterator, List, Optional
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
 import fitz  # PyMuPDF
-import ahocorasick
-import pytesseract
-from pdf2image import convert_from_bytes
-from PIL import Image
+import io
 import os
-import base64
-import requests
 
 # Import setup, models, and schemas from other files in the 'app' directory
-from . import database, models, schemas, crud, security
+from . import database, models, schemas, crud, security, ocr, dispatch, jobs, streaming, cache, automata, search, documents, batch, uploads, hashing, third_party, quotas, metering, metrics
 
 # --- Tier-based File Size Limits ---
 FREEMIUM_LIMIT_BYTES = 5 * 1024 * 1024  # 5 MB
 EXCLUSIVE_LIMIT_BYTES = 50 * 1024 * 1024 # 50 MB
+TIER_LIMIT_BYTES = {"freemium": FREEMIUM_LIMIT_BYTES, "exclusive": EXCLUSIVE_LIMIT_BYTES}
+# Streaming search holds one chunk at a time, so it accepts text files this many times
+# larger than the tier's limit (100 MB freemium, 1 GB exclusive by default)
+STREAM_SEARCH_LIMIT_MULTIPLIER = int(os.getenv("STREAM_SEARCH_LIMIT_MULTIPLIER", "20"))
+STREAM_TIER_LIMIT_BYTES = {tier: limit * STREAM_SEARCH_LIMIT_MULTIPLIER for tier, limit in TIER_LIMIT_BYTES.items()}
 # -------------------------------------
 
-THIRD_PARTY_API_ID = os.getenv("THIRD_PARTY_API_ID")
-THIRD_PARTY_API_SECRET = os.getenv("THIRD_PARTY_API_SECRET")
-THIRD_PARTY_API_BASE_URL = "http://20.255.59.96:8000"
-
 # This command creates all the database tables based on your models
 # if they don't exist already.
 models.Base.metadata.create_all(bind=database.engine)
+documents.ensure_search_index(database.engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    jobs.start_workers()
+    metering.start_flusher()
+    third_party.startup()
+    yield
+    # Stop the job workers, work pools, worker processes and upstream connections on shutdown,
+    # then write out any buffered usage
+    jobs.stop_workers()
+    dispatch.shutdown()
+    ocr.shutdown_pool()
+    hashing.shutdown_pool()
+    await third_party.shutdown()
+    metering.stop_flusher()
+    await database.dispose_async_engine()
+
+app = FastAPI(lifespan=lifespan, default_response_class=metrics.TimedJSONResponse)
 
-app = FastAPI()
+# Adds rate-limit headers and frees per-client concurrency slots once responses finish
+app.add_middleware(quotas.QuotaMiddleware)
+
+# Oversized uploads are cut off as they arrive, at the largest size any tier may send
+app.add_middleware(uploads.UploadLimitMiddleware, limits={
+    "/extract-text/": FREEMIUM_LIMIT_BYTES,
+    "/extract-text/batch": EXCLUSIVE_LIMIT_BYTES,
+    "/extract-text-ocr/": EXCLUSIVE_LIMIT_BYTES,
+    "/search-text/": EXCLUSIVE_LIMIT_BYTES,
+    "/search-pdf/": EXCLUSIVE_LIMIT_BYTES,
+    "/jobs/ocr": EXCLUSIVE_LIMIT_BYTES,
+}, stream_limits={
+    "/search-text/": max(STREAM_TIER_LIMIT_BYTES.values()),
+})
+
+# Outermost, so latency and Server-Timing cover everything above
+app.add_middleware(metrics.MetricsMiddleware)
 
 # --- API Endpoints ---
 
 @app.post("/register-client", response_model=schemas.ClientInfo)
-def register_client(client: schemas.ClientCreate, db: Session = Depends(database.get_db)):
+async def register_client(client: schemas.ClientCreate, db: crud.AnySession = Depends(database.get_async_db)):
     """
     Register a new client application to get its credentials.
     Defaults to the 'freemium' tier.
     """
-    db_client = crud.get_client_by_name(db, client_name=client.client_name)
+    db_client = await crud.get_client_by_name_async(db, client.client_name)
     if db_client:
         raise HTTPException(status_code=400, detail="Client name already registered")
     
-    new_client, plain_secret = crud.create_client(db=db, client=client)
+    plain_secret = hashing.new_secret()
+    hashed_secret = await hashing.hash_secret(plain_secret)
+    new_client = await crud.create_client_async(db, client, hashed_secret)
     
     return {
         "client_id": new_client.client_id, 
@@ -54,7 +90,7 @@ def register_client(client: schemas.ClientCreate, db: Session = Depends(database
 
 
 @app.post("/oauth/token", response_model=schemas.Token)
-def login_for_access_token(form_data: schemas.TokenRequestForm, db: Session = Depends(database.get_db)):
+async def login_for_access_token(form_data: schemas.TokenRequestForm, db: crud.AnySession = Depends(database.get_async_db)):
     """
     The Client Credentials Grant flow.
     """
@@ -64,7 +100,7 @@ def login_for_access_token(form_data: schemas.TokenRequestForm, db: Session = De
             detail="Unsupported grant type, must be 'client_credentials'",
         )
 
-    client = crud.authenticate_client(
+    client = await security.authenticate_client(
         db, client_id=form_data.client_id, client_secret=form_data.client_secret
     )
     if not client:
@@ -76,165 +112,705 @@ def login_for_access_token(form_data: schemas.TokenRequestForm, db: Session = De
     
     access_token_expires = timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        data={"sub": client.client_id}, expires_delta=access_token_expires
+        data={"sub": client.client_id, "tier": client.tier}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 # --- New Payment and Tier Endpoints ---
 
-@app.post("/upgrade-to-exclusive", response_model=schemas.UpgradeResponse)
-def upgrade_tier(
+@app.post("/upgrade-to-exclusive", response_model=schemas.UpgradeResponse, dependencies=[Depends(quotas.enforce())])
+async def upgrade_tier(
     current_client: models.Client = Depends(security.get_current_client),
-    db: Session = Depends(database.get_db)
+    db: crud.AnySession = Depends(database.get_async_db)
 ):
     """
     Mock payment endpoint. Upgrades the current client's tier to 'exclusive'.
     """
     if current_client.tier == "exclusive":
-        return {"message": "Client is already on the exclusive tier.", "client": current_client}
+        db_client = await crud.get_client_by_id_async(db, current_client.client_id)
+        return {"message": "Client is already on the exclusive tier.", "client": db_client}
+
+    updated_client = await crud.upgrade_client_tier_async(db, current_client.client_id)
+    access_token = security.create_access_token(
+        data={"sub": updated_client.client_id, "tier": updated_client.tier},
+        expires_delta=timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"message": "Upgrade successful!", "client": updated_client, "access_token": access_token}
+
+
+# --- Upload Validation ---
+
+def _check_upload_size(file: UploadFile, limit_bytes: int, tier: str) -> int:
+    """Rejects uploads that are over the tier's size limit. Returns the file's size."""
+    file_size = file.size
+    if file_size is None:
+        file.file.seek(0, 2)
+        file_size = file.file.tell()
+        file.file.seek(0)
+    if file_size > limit_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size exceeds the {limit_bytes // (1024 * 1024)}MB limit for the {tier} tier."
+        )
+    return file_size
+
+def _check_pdf_upload(file: UploadFile, limit_bytes: int, tier: str) -> int:
+    """Rejects uploads that are over the tier's size limit or are not PDFs. Returns the file's size."""
+    file_size = _check_upload_size(file, limit_bytes, tier)
+
+    if file.content_type != 'application/pdf':
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a PDF.")
+    return file_size
+
+
+def ocr_options(
+    dpi: int = Form(300, ge=72, le=600),
+    grayscale: bool = Form(True),
+    binarize_threshold: Optional[int] = Form(None, ge=0, le=255),
+    first_page: Optional[int] = Form(None, ge=1),
+    last_page: Optional[int] = Form(None, ge=1),
+    lang: str = Form("eng", pattern=schemas.OCR_LANG_PATTERN),
+    psm: Optional[int] = Form(None, ge=0, le=13),
+) -> schemas.OcrOptions:
+    """Collects the rasterization and tesseract options sent alongside an OCR upload."""
+    if first_page is not None and last_page is not None and first_page > last_page:
+        raise HTTPException(status_code=400, detail=f"first_page ({first_page}) is after last_page ({last_page}).")
+    return schemas.OcrOptions(
+        dpi=dpi, grayscale=grayscale, binarize_threshold=binarize_threshold,
+        first_page=first_page, last_page=last_page, lang=lang, psm=psm,
+    )
+
+
+def _check_store_options(stream: Optional[str], store: bool):
+    # Streaming keeps only one page in memory, so there is nothing to store at the end
+    if stream and store:
+        raise HTTPException(status_code=400, detail="'store' cannot be combined with 'stream'.")
+
+def _count_pages(pdf_bytes: bytes, options: Optional[dict] = None) -> int:
+    # Unreadable PDFs count as zero pages; the endpoint reports its own error for them
+    try:
+        page_count = ocr.count_pages(pdf_bytes)
+    except Exception:
+        return 0
+    if not options or not page_count:
+        return page_count
+    try:
+        return len(ocr.page_range(page_count, options))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _charge_upload(current_client: models.Client, upload: uploads.MappedUpload, file_size: int, options: Optional[dict] = None):
+    """
+    Counts an upload's pages and bytes against the client's daily budgets once its page
+    range is known to be valid, closing the upload if refused.
+    """
+    try:
+        await quotas.charge_pages(current_client, await run_in_threadpool(_count_pages, upload.data, options))
+        await quotas.charge_bytes(current_client, file_size)
+    except HTTPException:
+        upload.close()
+        raise
+
+def _detach_upload(file: UploadFile):
+    """
+    Takes ownership of an upload's spooled file so it outlives the request handler.
+    FastAPI closes form uploads before a streaming response runs; the caller must close it.
+    """
+    fileobj = file.file
+    file.file = io.BytesIO()
+    return fileobj
+
+def _stream_upload(pool: str, records: Iterator, upload, stream: str):
+    """
+    Streams records produced from a detached upload on the named pool. If the stream
+    can't start (e.g. 503 from a full pool), the upload is closed here, since the
+    records generator that would have closed it never runs.
+    """
+    try:
+        items = dispatch.stream(pool, records)
+    except Exception:
+        upload.close()
+        raise
+    try:
+        return streaming.response(items, stream)
+    except Exception:
+        items.release()
+        upload.close()
+        raise
+
+
+# --- Blocking Work Helpers ---
+# These run on the dispatch pools so they never block the event loop.
+
+def _iter_pdf_pages(pdf_bytes: bytes) -> Iterator[str]:
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for page in doc:
+            yield page.get_text()
+
+def _extract_pages(pdf_bytes: bytes) -> List[str]:
+    return cache.cached_pages(pdf_bytes, "extract", lambda: _iter_pdf_pages(pdf_bytes))
+
+def _extract_document(pdf_bytes: bytes) -> List[str]:
+    # Batch documents are extracted on the pool, so they are timed there
+    with metrics.stage("extract"):
+        pages = _extract_pages(pdf_bytes)
+    metrics.count_pages("extract", len(pages))
+    return pages
+
+def _page_text(page) -> str:
+    # Hybrid pages carry their text alongside the method used to get it
+    return page["text"] if isinstance(page, dict) else page
 
-    updated_client = crud.upgrade_client_tier(db, client_id=current_client.client_id)
-    return {"message": "Upgrade successful!", "client": updated_client}
+def _store_document(db: Session, client_id: str, filename: str, pdf_bytes: bytes, method: str, pages: list) -> str:
+    with metrics.stage("store"):
+        page_texts = [_page_text(page) for page in pages]
+        db_document = crud.create_document(db, client_id, filename, cache.document_hash(pdf_bytes), method, page_texts)
+    return db_document.id
 
 
 # --- Service Endpoints ---
 
-@app.post("/extract-text/")
+@app.post("/extract-text/", dependencies=[Depends(quotas.enforce(heavy=True))])
 async def extract_text_from_pdf(
     file: UploadFile = File(...),
-    current_client: models.Client = Depends(security.get_current_client) # Any authenticated client can use this
+    stream: Optional[str] = Query(None, pattern=streaming.STREAM_PATTERN),
+    store: bool = Query(False),
+    current_client: models.Client = Depends(security.get_current_client), # Any authenticated client can use this
+    db: Session = Depends(database.get_db)
 ):
     """
     Freemium endpoint to extract text from an uploaded PDF file.
+    With ?stream=ndjson or ?stream=sse, each page is sent as soon as it is extracted.
+    With ?store=true, the pages are saved to the client's document store for later searches.
     """
     # Check file size against the freemium limit
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    if file_size > FREEMIUM_LIMIT_BYTES:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File size exceeds the 5MB limit for the freemium tier."
-        )
-
-    if file.content_type != 'application/pdf':
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a PDF.")
+    file_size = _check_pdf_upload(file, FREEMIUM_LIMIT_BYTES, "freemium")
+    _check_store_options(stream, store)
     try:
-        pdf_bytes = await file.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        extracted_text = "".join(page.get_text() for page in doc)
-        doc.close()
-        return {"filename": file.filename, "text": extracted_text, "authorized_client": current_client.client_id, "tier_access": "freemium"}
+        # Streamed responses outlive the handler, so they take ownership of the upload
+        upload = uploads.MappedUpload(_detach_upload(file) if stream else file.file)
+        await _charge_upload(current_client, upload, file_size)
+        if stream:
+            pages = cache.iter_cached_pages(upload.data, "extract", lambda: _iter_pdf_pages(upload.data))
+            pages = metrics.iter_stage("extract", pages, pages_mode="extract")
+            records = uploads.iter_closing(streaming.page_records(pages), upload)
+            return _stream_upload("extract", records, upload, stream)
+        with upload as pdf_bytes:
+            with metrics.stage("extract"):
+                pages = await dispatch.run("extract", _extract_pages, pdf_bytes)
+            metrics.count_pages("extract", len(pages))
+            response = {"filename": file.filename, "text": "".join(pages), "authorized_client": current_client.client_id, "tier_access": "freemium"}
+            if store:
+                response["document_id"] = await run_in_threadpool(
+                    _store_document, db, current_client.client_id, file.filename, pdf_bytes, "extract", pages
+                )
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing PDF file: {e}")
 
-@app.post("/extract-text-ocr/")
+@app.post("/extract-text/batch", dependencies=[Depends(quotas.enforce(heavy=True))])
+async def extract_text_batch(
+    files: List[UploadFile] = File(...),
+    stream: str = Query("ndjson", pattern=streaming.STREAM_PATTERN),
+    current_client: models.Client = Depends(security.get_current_client)
+):
+    """
+    Extracts text from many PDFs in one request. Upload several files, ZIP archives
+    of PDFs, or both; the tier's size limit applies to the whole batch (uncompressed).
+    Documents are extracted in parallel and one record is streamed per document as
+    soon as it finishes, in completion order; "document" is its position in the batch.
+    """
+    limit_bytes = TIER_LIMIT_BYTES[current_client.tier]
+    documents = await run_in_threadpool(batch.read_documents, files, limit_bytes, current_client.tier)
+    page_count = await run_in_threadpool(lambda: sum(_count_pages(pdf_bytes) for _, pdf_bytes in documents))
+    await quotas.charge_pages(current_client, page_count)
+    await quotas.charge_bytes(current_client, sum(file.size or 0 for file in files))
+    return streaming.response(batch.document_records(documents, _extract_document), stream)
+
+@app.post("/extract-text-ocr/", dependencies=[Depends(quotas.enforce(heavy=True, required_tier="exclusive"))])
 async def extract_text_from_pdf_ocr(
     file: UploadFile = File(...),
-    current_client: models.Client = Depends(security.require_tier("exclusive")) # ONLY exclusive clients can use this
+    stream: Optional[str] = Query(None, pattern=streaming.STREAM_PATTERN),
+    mode: str = Query("ocr", pattern="^(ocr|hybrid)$"),
+    options: schemas.OcrOptions = Depends(ocr_options),
+    store: bool = Query(False),
+    current_client: models.Client = Depends(security.require_tier("exclusive")), # ONLY exclusive clients can use this
+    db: Session = Depends(database.get_db)
 ):
     """
     Exclusive endpoint to extract text from a PDF using a real OCR library.
+    Form fields dpi, grayscale, binarize_threshold, first_page, last_page, lang and psm
+    control rasterization and tesseract, trading accuracy for speed.
+    With ?mode=hybrid, pages that already have a text layer are read directly and
+    only image-only pages are OCR'd; the response reports the method used per page.
+    With ?stream=ndjson or ?stream=sse, each page is sent as soon as it is OCR'd.
+    With ?store=true, the pages are saved to the client's document store for later searches.
     """
     # Check file size against the exclusive limit
-    file.file.seek(0, 2)
-    file_size = file.file.tell()
-    file.file.seek(0)
-    if file_size > EXCLUSIVE_LIMIT_BYTES:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"File size exceeds the 50MB limit for the exclusive tier."
-        )
-
-    if file.content_type != 'application/pdf':
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a PDF.")
+    file_size = _check_pdf_upload(file, EXCLUSIVE_LIMIT_BYTES, "exclusive")
+    _check_store_options(stream, store)
 
     try:
-        pdf_bytes = await file.read()
-        
-        # Step 1: Convert PDF pages to images
-        images = convert_from_bytes(pdf_bytes)
-        
-        # Step 2: Run OCR on each image and combine the text
-        ocr_text = ""
-        for image in images:
-            ocr_text += pytesseract.image_to_string(image) + "\n"
-
-        return {
-            "filename": file.filename, 
-            "ocr_text": ocr_text,
-            "authorized_client": current_client.client_id,
-            "tier_access": "exclusive"
-        }
+        # Streamed responses outlive the handler, so they take ownership of the upload
+        upload = uploads.MappedUpload(_detach_upload(file) if stream else file.file)
+        pdf_bytes = upload.data
+        resolved = ocr.resolve_options(options.model_dump())
+        await _charge_upload(current_client, upload, file_size, resolved)
+        meter_ocr = metering.ocr_seconds_recorder(current_client.client_id)
+        if mode == "hybrid":
+            produce = lambda: ocr.iter_hybrid_pages(pdf_bytes, options=resolved, on_page_seconds=meter_ocr)
+            cache_options = {**resolved, "min_chars": ocr.HYBRID_MIN_CHARS}
+        else:
+            produce = lambda: ocr.iter_ocr_pages(pdf_bytes, options=resolved, on_page_seconds=meter_ocr)
+            cache_options = resolved
+        first_page = resolved["first_page"] or 1
+        if stream:
+            pages = cache.iter_cached_pages(pdf_bytes, mode, produce, cache_options)
+            pages = metrics.iter_stage("ocr", pages, pages_mode=mode)
+            records = uploads.iter_closing(streaming.page_records(pages, first_page), upload)
+            return _stream_upload("ocr", records, upload, stream)
+        with upload:
+            with metrics.stage("ocr"):
+                pages = await dispatch.run("ocr", cache.cached_pages, pdf_bytes, mode, produce, cache_options)
+            metrics.count_pages(mode, len(pages))
+
+            response = {
+                "filename": file.filename, 
+                "ocr_text": "".join(_page_text(page) + "\n" for page in pages),
+                "authorized_client": current_client.client_id,
+                "tier_access": "exclusive"
+            }
+            if mode == "hybrid":
+                response["pages"] = [
+                    {"page": number, "method": page["method"], "chars": len(page["text"])}
+                    for number, page in enumerate(pages, start=first_page)
+                ]
+            if store:
+                response["document_id"] = await run_in_threadpool(
+                    _store_document, db, current_client.client_id, file.filename, pdf_bytes, mode, pages
+                )
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during OCR processing: {e}")
 
 
-@app.post("/search-text/")
+async def _get_automaton(keywords: Optional[List[str]], keyword_set_id: Optional[str], client_id: str, db: Session,
+                         case_insensitive: bool = False):
+    """
+    Resolves the automaton for a search from either an ad-hoc keyword list or a
+    registered keyword set. Compiled automata are cached, so this is usually a lookup.
+    """
+    if (keywords is None) == (keyword_set_id is None):
+        raise HTTPException(status_code=400, detail="Provide either 'keywords' or 'keyword_set_id'.")
+    if keyword_set_id is None:
+        if not automata.normalize_keywords(keywords):
+            raise HTTPException(status_code=400, detail="Provide at least one non-empty keyword.")
+        with metrics.stage("automaton"):
+            return await dispatch.run("search", automata.automaton_for, keywords, case_insensitive)
+    db_set = await run_in_threadpool(crud.get_keyword_set, db, keyword_set_id=keyword_set_id, client_id=client_id)
+    if db_set is None:
+        raise HTTPException(status_code=404, detail="Keyword set not found")
+    load_keywords = lambda: crud.get_keyword_set_keywords(db, keyword_set_id)
+    with metrics.stage("automaton"):
+        return await dispatch.run("search", automata.get_automaton, db_set.digest, load_keywords, case_insensitive)
+
+@app.post("/search-text/", dependencies=[Depends(quotas.enforce(heavy=True))])
 async def search_text_with_aho_corasick(
-    keywords: List[str] = Form(...),
+    keywords: Optional[List[str]] = Form(None),
+    keyword_set_id: Optional[str] = Form(None),
     file: UploadFile = File(...),
-    current_client: models.Client = Depends(security.get_current_client) # Any authenticated client can use this
+    match_mode: str = Form("all", pattern=search.MATCH_MODE_PATTERN),
+    case_insensitive: bool = Form(False),
+    whole_word: bool = Form(False),
+    stream: Optional[str] = Query(None, pattern=streaming.STREAM_PATTERN),
+    current_client: models.Client = Depends(security.get_current_client), # Any authenticated client can use this
+    db: Session = Depends(database.get_db)
 ):
     """
     Freemium endpoint to search for multiple keywords in a text file.
+    Send the keywords directly, or the ID of a keyword set registered with POST /keyword-sets.
+    match_mode picks the result shape: "all" (one entry per match), "count" (totals per
+    keyword), "first" (first match per keyword) or "positions" (compact parallel arrays).
+    case_insensitive and whole_word are applied during the scan.
+    With ?stream=ndjson or ?stream=sse, matches are sent as they are found and memory
+    stays constant, so much larger files are accepted.
     """
-    A = ahocorasick.Automaton()
-    for index, keyword in enumerate(keywords):
-        A.add_word(keyword, (index, keyword))
-    A.make_automaton()
+    if stream:
+        file_size = _check_upload_size(file, STREAM_TIER_LIMIT_BYTES[current_client.tier], current_client.tier)
+    else:
+        file_size = _check_upload_size(file, TIER_LIMIT_BYTES[current_client.tier], current_client.tier)
+    A = await _get_automaton(keywords, keyword_set_id, current_client.client_id, db, case_insensitive)
+    await quotas.charge_bytes(current_client, file_size)
+    if stream:
+        fileobj = _detach_upload(file)
+        records = search.iter_match_records(A, fileobj, match_mode, case_insensitive, whole_word)
+        return _stream_upload("search", metrics.iter_stage("search", records), fileobj, stream)
     try:
-        text_content = (await file.read()).decode('utf-8')
+        with metrics.stage("search"):
+            found_keywords = await dispatch.run(
+                "search", search.find_all, A, file.file, match_mode, case_insensitive, whole_word
+            )
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="Could not decode file content as UTF-8.")
-    found_keywords = [
-        {"keyword": original_keyword, "start_index": end_index - len(original_keyword) + 1, "end_index": end_index}
-        for end_index, (insert_order, original_keyword) in A.iter(text_content)
-    ]
-    return {"filename": file.filename, "found_keywords": found_keywords, "authorized_client": current_client.client_id, "tier_access": "freemium"}
+    return {"filename": file.filename, "match_mode": match_mode, "found_keywords": found_keywords, "authorized_client": current_client.client_id, "tier_access": "freemium"}
+
+
+@app.get("/cache/stats", dependencies=[Depends(quotas.enforce())])
+def get_cache_stats(current_client: models.Client = Depends(security.get_current_client)):
+    """
+    Reports result cache hit/miss/eviction counters and tier sizes, for sizing the cache.
+    """
+    return cache.result_cache.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(request: Request):
+    """
+    Prometheus metrics for this worker: request latency per route, in-flight requests,
+    work pool occupancy, per-stage timings and pages processed.
+    Requires "Authorization: Bearer <METRICS_TOKEN>" when METRICS_TOKEN is set.
+    """
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/usage", response_model=schemas.UsageReport, dependencies=[Depends(quotas.enforce())])
+def get_usage(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Reports the client's metered usage (requests, uploaded bytes, pages, OCR seconds and
+    detection calls) per bucket between start and end, by default the last 24 hours.
+    Usage not yet written to the database by this worker is included.
+    """
+    end = _as_utc(end) if end else datetime.now(timezone.utc)
+    start = _as_utc(start) if start else end - timedelta(days=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end.")
+    # Include the bucket that start falls in
+    bucket_from = datetime.fromtimestamp(metering.bucket_start(start.timestamp()), timezone.utc)
+
+    buckets = {}
+    for row in crud.get_usage(db, current_client.client_id, bucket_from, end):
+        buckets[_as_utc(row.bucket_start)] = {field: getattr(row, field) for field in crud.USAGE_FIELDS}
+    for bucket, counts in metering.pending(current_client.client_id).items():
+        if bucket_from <= bucket < end:
+            merged = buckets.setdefault(bucket, {field: 0 for field in crud.USAGE_FIELDS})
+            for field, amount in counts.items():
+                merged[field] += amount
+
+    totals = {field: sum(counts[field] for counts in buckets.values()) for field in crud.USAGE_FIELDS}
+    return schemas.UsageReport(
+        client_id=current_client.client_id,
+        bucket_seconds=metering.METERING_BUCKET_SECONDS,
+        start=start,
+        end=end,
+        totals=schemas.UsageCounts(**totals),
+        buckets=[schemas.UsageBucket(bucket_start=bucket, **buckets[bucket]) for bucket in sorted(buckets)],
+    )
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite returns naive datetimes; treat naive values as UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+# --- Asynchronous OCR Job Endpoints ---
+
+def _job_info(db_job: models.OcrJob) -> schemas.OcrJobInfo:
+    return schemas.OcrJobInfo(
+        job_id=db_job.id,
+        filename=db_job.filename,
+        status=db_job.status,
+        pages_done=db_job.pages_done,
+        pages_total=db_job.pages_total,
+        error=db_job.error,
+        created_at=db_job.created_at,
+        updated_at=db_job.updated_at,
+    )
+
+@app.post("/jobs/ocr", response_model=schemas.OcrJobInfo, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(quotas.enforce(required_tier="exclusive"))])
+async def submit_ocr_job(
+    file: UploadFile = File(...),
+    options: schemas.OcrOptions = Depends(ocr_options),
+    current_client: models.Client = Depends(security.require_tier("exclusive")),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Exclusive endpoint to queue a PDF for OCR. Returns a job ID immediately;
+    poll GET /jobs/{job_id} for progress and fetch GET /jobs/{job_id}/result when done.
+    Accepts the same OCR options as /extract-text-ocr/.
+    """
+    file_size = _check_pdf_upload(file, EXCLUSIVE_LIMIT_BYTES, "exclusive")
+    active_jobs = await run_in_threadpool(crud.count_active_ocr_jobs, db, current_client.client_id)
+    quotas.check_queued_jobs(current_client, active_jobs)
+    upload = uploads.MappedUpload(file.file)
+    await _charge_upload(current_client, upload, file_size, ocr.resolve_options(options.model_dump()))
+    with upload as pdf_bytes:
+        db_job = await run_in_threadpool(
+            crud.create_ocr_job, db, current_client.client_id, file.filename, pdf_bytes, options.model_dump()
+        )
+    return _job_info(db_job)
+
+@app.get("/jobs/{job_id}", response_model=schemas.OcrJobInfo, dependencies=[Depends(quotas.enforce())])
+def get_ocr_job_status(
+    job_id: str,
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Reports the status and page progress of one of the client's OCR jobs.
+    """
+    db_job = crud.get_ocr_job(db, job_id=job_id, client_id=current_client.client_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_info(db_job)
+
+@app.get("/jobs/{job_id}/result", response_model=schemas.OcrJobResult, dependencies=[Depends(quotas.enforce())])
+def get_ocr_job_result(
+    job_id: str,
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Returns the OCR text of a finished job.
+    """
+    db_job = crud.get_ocr_job(db, job_id=job_id, client_id=current_client.client_id)
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if db_job.status != "done":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Job is {db_job.status}." + (f" {db_job.error}" if db_job.error else "")
+        )
+    return {"job_id": db_job.id, "filename": db_job.filename, "ocr_text": db_job.result_text}
+
+@app.post("/search-pdf/", dependencies=[Depends(quotas.enforce(heavy=True))])
+async def search_pdf_with_aho_corasick(
+    keywords: Optional[List[str]] = Form(None),
+    keyword_set_id: Optional[str] = Form(None),
+    file: UploadFile = File(...),
+    match_mode: str = Form("all", pattern=search.MATCH_MODE_PATTERN),
+    case_insensitive: bool = Form(False),
+    whole_word: bool = Form(False),
+    ocr_fallback: bool = Form(False),
+    stream: Optional[str] = Query(None, pattern=streaming.STREAM_PATTERN),
+    current_client: models.Client = Depends(security.get_current_client), # Any authenticated client can use this
+    db: Session = Depends(database.get_db),
+    auth_db: crud.AnySession = Depends(database.get_async_db)
+):
+    """
+    Searches for keywords inside a PDF page by page, without returning its text.
+    Matches carry the page number and offsets within that page.
+    With ocr_fallback (exclusive tier only), pages without a usable text layer are OCR'd.
+    Accepts the same keyword, match and stream options as /search-text/.
+    """
+    if ocr_fallback:
+        # Same database re-check as require_tier, since the token's tier may be stale
+        current_client = await security.check_tier(
+            current_client, "exclusive", auth_db, detail="OCR fallback requires the 'exclusive' tier."
+        )
+    file_size = _check_pdf_upload(file, TIER_LIMIT_BYTES[current_client.tier], current_client.tier)
+    A = await _get_automaton(keywords, keyword_set_id, current_client.client_id, db, case_insensitive)
+    # Streamed responses outlive the handler, so they take ownership of the upload
+    upload = uploads.MappedUpload(_detach_upload(file) if stream else file.file)
+    await _charge_upload(current_client, upload, file_size)
+    pdf_bytes = upload.data
+    if ocr_fallback:
+        # Shares cache entries with /extract-text-ocr/?mode=hybrid at default options
+        options = ocr.resolve_options()
+        pages = cache.iter_cached_pages(
+            pdf_bytes, "hybrid",
+            lambda: ocr.iter_hybrid_pages(
+                pdf_bytes, options=options, on_page_seconds=metering.ocr_seconds_recorder(current_client.client_id)
+            ),
+            {**options, "min_chars": ocr.HYBRID_MIN_CHARS}
+        )
+        pages = metrics.iter_stage("ocr", pages, pages_mode="hybrid")
+        pool = "ocr"
+    else:
+        pages = cache.iter_cached_pages(pdf_bytes, "extract", lambda: _iter_pdf_pages(pdf_bytes))
+        pages = metrics.iter_stage("extract", pages, pages_mode="extract")
+        pool = "search"
+    if stream:
+        records = search.iter_page_match_records(A, pages, match_mode, case_insensitive, whole_word)
+        records = metrics.iter_stage("search", uploads.iter_closing(records, upload))
+        return _stream_upload(pool, records, upload, stream)
+    try:
+        # Pages are extracted or OCR'd as the search reaches them, so "search" includes that time
+        with upload, metrics.stage("search"):
+            found_keywords, stats = await dispatch.run(
+                pool, search.find_in_pages, A, pages, match_mode, case_insensitive, whole_word
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing PDF file: {e}")
+    return {
+        "filename": file.filename,
+        "match_mode": match_mode,
+        **stats,
+        "found_keywords": found_keywords,
+        "authorized_client": current_client.client_id,
+        "tier_access": current_client.tier
+    }
+
+
+# --- Document Store Endpoints ---
+
+def _document_info(db_document: models.Document) -> schemas.DocumentInfo:
+    return schemas.DocumentInfo(
+        document_id=db_document.id,
+        filename=db_document.filename,
+        sha256=db_document.sha256,
+        method=db_document.method,
+        page_count=db_document.page_count,
+        created_at=db_document.created_at,
+    )
+
+@app.get("/documents", response_model=List[schemas.DocumentInfo], dependencies=[Depends(quotas.enforce())])
+def list_documents(
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Lists the documents the client has stored with ?store=true, newest first.
+    """
+    db_documents = crud.get_documents(db, client_id=current_client.client_id, limit=limit, offset=offset)
+    return [_document_info(db_document) for db_document in db_documents]
+
+@app.get("/documents/search", response_model=schemas.DocumentSearchResult, dependencies=[Depends(quotas.enforce())])
+def search_documents(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Full-text search across all of the client's stored documents. Returns the matching
+    pages (all query terms present), best matches first, with a highlighted snippet.
+    """
+    if not q.split():
+        raise HTTPException(status_code=400, detail="Query must contain at least one term.")
+    # Fetch one extra row to tell whether another page of results exists
+    hits = documents.search_pages(db, current_client.client_id, q, limit + 1, offset)
+    return {"query": q, "limit": limit, "offset": offset, "has_more": len(hits) > limit, "hits": hits[:limit]}
+
+@app.delete("/documents/{document_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(quotas.enforce())])
+def delete_document(
+    document_id: str,
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Removes one of the client's stored documents.
+    """
+    db_document = crud.get_document(db, document_id=document_id, client_id=current_client.client_id)
+    if db_document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    crud.delete_document(db, db_document)
+
+
+# --- Keyword Set Endpoints ---
+
+def _keyword_set_info(db_set: models.KeywordSet) -> schemas.KeywordSetInfo:
+    return schemas.KeywordSetInfo(
+        keyword_set_id=db_set.id,
+        name=db_set.name,
+        keyword_count=db_set.keyword_count,
+        digest=db_set.digest,
+        created_at=db_set.created_at,
+    )
+
+@app.post("/keyword-sets", response_model=schemas.KeywordSetInfo, status_code=status.HTTP_201_CREATED, dependencies=[Depends(quotas.enforce())])
+async def create_keyword_set(
+    keyword_set: schemas.KeywordSetCreate,
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Registers a named keyword set and compiles its automaton once.
+    Search with it by passing the returned keyword_set_id to /search-text/.
+    """
+    keywords = automata.normalize_keywords(keyword_set.keywords)
+    if not keywords:
+        raise HTTPException(status_code=400, detail="Keyword set must contain at least one non-empty keyword.")
+    digest = automata.keyword_digest(keywords)
+    await dispatch.run("search", automata.get_automaton, digest, lambda: keywords)
+    db_set = await run_in_threadpool(
+        crud.create_keyword_set, db, current_client.client_id, keyword_set.name, keywords, digest
+    )
+    return _keyword_set_info(db_set)
+
+@app.get("/keyword-sets", response_model=List[schemas.KeywordSetInfo], dependencies=[Depends(quotas.enforce())])
+def list_keyword_sets(
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Lists the client's registered keyword sets.
+    """
+    return [_keyword_set_info(db_set) for db_set in crud.get_keyword_sets(db, client_id=current_client.client_id)]
+
+@app.delete("/keyword-sets/{keyword_set_id}", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(quotas.enforce())])
+def delete_keyword_set(
+    keyword_set_id: str,
+    current_client: models.Client = Depends(security.get_current_client),
+    db: Session = Depends(database.get_db)
+):
+    """
+    Removes one of the client's keyword sets.
+    """
+    db_set = crud.get_keyword_set(db, keyword_set_id=keyword_set_id, client_id=current_client.client_id)
+    if db_set is None:
+        raise HTTPException(status_code=404, detail="Keyword set not found")
+    crud.delete_keyword_set(db, db_set)
 
     # --- New Endpoint to Integrate with Third-Party API ---
-@app.post("/detect-explicit")
+@app.post("/detect-explicit", dependencies=[Depends(quotas.enforce())])
 async def detect_explicit_content(
     data: schemas.DetectRequest,
     current_client: models.Client = Depends(security.get_current_client)
 ):
     """
     Protected endpoint that calls a third-party API to detect explicit content.
+    Results are cached per text, and concurrent requests share upstream calls.
     """
-    if not THIRD_PARTY_API_ID or not THIRD_PARTY_API_SECRET:
-        raise HTTPException(status_code=500, detail="Third-party API credentials are not configured on the server.")
-
+    metering.record(current_client.client_id, detect_calls=1)
     try:
-        # 1. Get a token from the third-party API
-        credentials = f"{THIRD_PARTY_API_ID}:{THIRD_PARTY_API_SECRET}"
-        encoded_credentials = base64.b64encode(credentials.encode()).decode()
-        
-        token_response = requests.post(
-            f"{THIRD_PARTY_API_BASE_URL}/oauth/token",
-            headers={"Authorization": f"Bearer {encoded_credentials}"},
-            json={"grant_type": "client_credentials"}
-        )
-        token_response.raise_for_status()
-        third_party_token = token_response.json()["access_token"]
-
-        # 2. Use the token to call the detection endpoint
-        detect_headers = {
-            "Authorization": f"Bearer {third_party_token}",
-            "Content-Type": "application/json"
-        }
-        detect_response = requests.post(
-            f"{THIRD_PARTY_API_BASE_URL}/detect",
-            headers=detect_headers,
-            json={"text": data.text}
-        )
-        detect_response.raise_for_status()
-
-        # 3. Return the result from the third-party API to our client
-        return detect_response.json()
-
-    except requests.exceptions.HTTPError as e:
-        # Forward the error from the third-party API
-        raise HTTPException(status_code=e.response.status_code, detail=f"Error from third-party API: {e.response.text}")
+        with metrics.stage("upstream"):
+            return await third_party.detect(data.text)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An internal error occurred: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {e}")
+
+@app.post("/detect-explicit/batch", dependencies=[Depends(quotas.enforce())])
+async def detect_explicit_content_batch(
+    data: schemas.DetectBatchRequest,
+    current_client: models.Client = Depends(security.get_current_client)
+):
+    """
+    Runs explicit-content detection on a list of texts. Results are returned in the
+    order of the texts; a text that could not be checked gets an "error" entry instead.
+    """
+    if len(data.texts) > third_party.DETECT_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=400, detail=f"A batch may contain at most {third_party.DETECT_BATCH_MAX_TEXTS} texts.")
+    metering.record(current_client.client_id, detect_calls=len(data.texts))
+    with metrics.stage("upstream"):
+        results = await third_party.detect_many(data.texts)
+    return {
+        "results": [
+            {"error": result.detail if isinstance(result, HTTPException) else str(result)}
+            if isinstance(result, Exception) else result
+            for result in results
+        ]
+    }
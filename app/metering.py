@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from . import crud, database
+
+# --- Usage Metering Settings ---
+# Usage is aggregated per client into buckets of this many seconds
+METERING_BUCKET_SECONDS = int(os.getenv("METERING_BUCKET_SECONDS", "3600"))  # 1 hour
+# Buffered usage is written to the database on this interval, or sooner once this
+# many client buckets are waiting
+METERING_FLUSH_INTERVAL_SECONDS = float(os.getenv("METERING_FLUSH_INTERVAL_SECONDS", "10"))
+METERING_FLUSH_THRESHOLD = int(os.getenv("METERING_FLUSH_THRESHOLD", "1000"))
+METERING_ENABLED = os.getenv("METERING_ENABLED", "true").lower() in ("1", "true", "yes")
+# -------------------------------------
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# (client_id, bucket start as a UNIX timestamp) -> field -> amount
+_buffer: Dict[Tuple[str, int], Dict[str, float]] = {}
+_flush_now = threading.Event()
+_stop = threading.Event()
+_flusher: Optional[threading.Thread] = None
+
+def bucket_start(timestamp: float) -> int:
+    return int(timestamp) - int(timestamp) % METERING_BUCKET_SECONDS
+
+def _to_datetime(timestamp: int) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+def record(client_id: str, **amounts: float):
+    """
+    Adds usage (requests, bytes_uploaded, pages, ocr_seconds, detect_calls) for a client
+    to the in-memory buffer. Cheap and thread-safe; the database is written later in bulk.
+    """
+    if not METERING_ENABLED:
+        return
+    key = (client_id, bucket_start(time.time()))
+    with _lock:
+        counts = _buffer.get(key)
+        if counts is None:
+            counts = _buffer[key] = defaultdict(float)
+        for field, amount in amounts.items():
+            counts[field] += amount
+        if len(_buffer) >= METERING_FLUSH_THRESHOLD:
+            _flush_now.set()
+
+def ocr_seconds_recorder(client_id: str) -> Callable[[float], None]:
+    """Returns an on_page_seconds callback for the OCR functions that meters a client's OCR time."""
+    return lambda seconds: record(client_id, ocr_seconds=seconds)
+
+def pending(client_id: str) -> Dict[datetime, Dict[str, float]]:
+    """Returns this process's not-yet-flushed usage for a client, by bucket start."""
+    with _lock:
+        return {
+            _to_datetime(start): dict(counts)
+            for (buffered_client, start), counts in _buffer.items() if buffered_client == client_id
+        }
+
+def _db_counts(counts: Dict[str, float]) -> Dict[str, float]:
+    # Everything but OCR seconds is a whole count
+    return {field: amount if field == "ocr_seconds" else int(amount) for field, amount in counts.items()}
+
+def flush():
+    """Writes all buffered usage in one transaction. On failure the usage is put back."""
+    global _buffer
+    with _lock:
+        batch, _buffer = _buffer, {}
+    if not batch:
+        return
+    db = database.SessionLocal()
+    try:
+        for (client_id, start), counts in batch.items():
+            try:
+                crud.add_usage(db, client_id, _to_datetime(start), _db_counts(counts))
+            except IntegrityError:
+                # Another process inserted the bucket first; its row can be incremented now
+                crud.add_usage(db, client_id, _to_datetime(start), _db_counts(counts))
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.exception("Could not write %d usage buckets; will retry", len(batch))
+        with _lock:
+            for key, counts in batch.items():
+                merged = _buffer.setdefault(key, defaultdict(float))
+                for field, amount in counts.items():
+                    merged[field] += amount
+    finally:
+        db.close()
+
+def _flush_loop():
+    while not _stop.is_set():
+        _flush_now.wait(METERING_FLUSH_INTERVAL_SECONDS)
+        _flush_now.clear()
+        flush()
+
+def start_flusher():
+    """Starts the background thread that writes buffered usage to the database."""
+    global _flusher
+    _stop.clear()
+    _flusher = threading.Thread(target=_flush_loop, name="usage-flusher", daemon=True)
+    _flusher.start()
+
+def stop_flusher():
+    """Stops the flusher and writes whatever is still buffered."""
+    global _flusher
+    _stop.set()
+    _flush_now.set()
+    if _flusher is not None:
+        _flusher.join(timeout=5)
+        _flusher = None
+    flush()
@@ -0,0 +1,326 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from . import dispatch
+
+# --- Metrics Settings ---
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# If set, GET /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Add a Server-Timing header with the stage breakdown to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+# Slow-request profiling (needs the pyinstrument package): this fraction of requests is
+# sampled, and the profile is kept when the request took at least the threshold. 0 disables.
+PROFILE_SLOW_REQUEST_SECONDS = float(os.getenv("PROFILE_SLOW_REQUEST_SECONDS", "0"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0.05"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+# -------------------------------------
+
+logger = logging.getLogger(__name__)
+
+# Seconds; the upper buckets cover OCR of large documents
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _le(bound) -> str:
+    return f'le="{bound}"'
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+# --- Metric types ---
+# A small, dependency-free subset of the Prometheus client: per-process counters,
+# gauges and histograms with fixed label names, rendered in the text exposition format.
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = labels
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        # Unlabelled metrics are reported from the start, as 0
+        self._values: Dict[LabelValues, float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(_Metric):
+    """A gauge that is set directly, or read from a callback returning {label values: value} at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        # Unlabelled metrics are reported from the start, as 0
+        self._values: Dict[LabelValues, float] = {} if labels else {(): 0}
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        if self._callback is not None:
+            values = list(self._callback().items())
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self._values: Dict[LabelValues, list] = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, _le(bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, _le('+Inf'))} {state[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {state[-1]}")
+        return lines
+
+registry: List[_Metric] = []
+
+def render() -> str:
+    """Returns every metric in the Prometheus text exposition format."""
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+# --- Metrics ---
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time from receiving a request until its response was fully sent.",
+    ("method", "route", "status"),
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+WORK_POOL_ADMITTED = Gauge(
+    "work_pool_admitted", "Jobs running or waiting on each work pool.", ("pool",),
+    callback=lambda: {(name,): pool.admitted for name, pool in dispatch.pools.items()},
+)
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent in each processing stage.", ("stage",))
+PAGES_PROCESSED = Counter("pages_processed_total", "PDF pages extracted, OCR'd or searched, by processing mode.", ("mode",))
+SLOW_REQUESTS_PROFILED = Counter("slow_requests_profiled_total", "Sampled requests slow enough to keep their profile.")
+
+# --- Stage timers ---
+# Each request collects its stages in a list held in a context variable; code that runs
+# outside the request's context (e.g. on a dispatch pool) still feeds the histogram.
+
+_request_stages: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_stages", default=None)
+
+def record_stage(name: str, seconds: float):
+    """Adds a finished stage to the histogram and to the current request's Server-Timing."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+@contextmanager
+def stage(name: str):
+    """Times the enclosed block as the named stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def iter_stage(name: str, iterator: Iterator, pages_mode: Optional[str] = None) -> Iterator:
+    """
+    Times the work done producing each item of iterator as the named stage, recorded once
+    the iterator is finished. With pages_mode, each item also counts as a processed page.
+    """
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            if pages_mode is not None:
+                PAGES_PROCESSED.inc(mode=pages_mode)
+            yield item
+    finally:
+        record_stage(name, elapsed)
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+def count_pages(mode: str, pages: int):
+    PAGES_PROCESSED.inc(pages, mode=mode)
+
+def server_timing(stages: List[Tuple[str, float]], total: float) -> str:
+    """Formats stages (summed per name) and the total as a Server-Timing header value, in milliseconds."""
+    durations: Dict[str, float] = {}
+    for name, seconds in stages:
+        durations[name] = durations.get(name, 0.0) + seconds
+    durations["app"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse that times encoding the body as the "serialize" stage."""
+    def render(self, content) -> bytes:
+        with stage("serialize"):
+            return super().render(content)
+
+# --- Slow request profiler ---
+
+_profiler_class = None
+_profiler_checked = False
+
+def _get_profiler_class():
+    """Imports pyinstrument on first use; profiling is switched off if it is missing."""
+    global _profiler_class, _profiler_checked
+    if not _profiler_checked:
+        _profiler_checked = True
+        try:
+            from pyinstrument import Profiler
+            _profiler_class = Profiler
+        except ImportError:
+            logger.warning("PROFILE_SLOW_REQUEST_SECONDS is set but pyinstrument is not installed; profiling is off")
+    return _profiler_class
+
+def _start_profiler():
+    if PROFILE_SLOW_REQUEST_SECONDS <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    profiler_class = _get_profiler_class()
+    if profiler_class is None:
+        return None
+    profiler = profiler_class(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+def _finish_profiler(profiler, method: str, route: str, seconds: float):
+    profiler.stop()
+    if seconds < PROFILE_SLOW_REQUEST_SECONDS:
+        return
+    SLOW_REQUESTS_PROFILED.inc()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{method}-{re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_')}.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_text(unicode=True))
+    logger.warning("%s %s took %.2fs; profile written to %s", method, route, seconds, path)
+
+# --- Middleware ---
+
+class MetricsMiddleware:
+    """
+    Records request latency and in-flight requests per route, adds a Server-Timing
+    header with the stages timed while handling the request, and samples slow requests
+    with the profiler when enabled. The "upload" stage is the time until the request
+    body has been fully received.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        stages: List[Tuple[str, float]] = []
+        token = _request_stages.set(stages)
+        status_code = 500
+        body_received = False
+
+        async def timed_receive():
+            nonlocal body_received
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False) and not body_received:
+                body_received = True
+                record_stage("upload", time.perf_counter() - start)
+            return message
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    timing = server_timing(stages, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        profiler = _start_profiler()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, timed_receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _request_stages.reset(token)
+            seconds = time.perf_counter() - start
+            # Route templates keep the label set small; unmatched paths share one label
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(seconds, method=scope["method"], route=route, status=str(status_code))
+            if profiler is not None:
+                _finish_profiler(profiler, scope["method"], route, seconds)
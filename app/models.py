@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, LargeBinary, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import deferred
 from .database import Base
 
 class Client(Base):
@@ -11,4 +13,75 @@ class Client(Base):
     email = Column(String(255), unique=True, index=True)
     redirect_uri = Column(String(255))
     # --- New Tier Column ---
-    tier = Column(String(50), default="freemium", nullable=False)
\ No newline at end of file
+    tier = Column(String(50), default="freemium", nullable=False)
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+class OcrJob(Base):
+    __tablename__ = "ocr_jobs"
+
+    id = Column(String(64), primary_key=True, index=True)
+    client_id = Column(String(255), index=True, nullable=False)
+    filename = Column(String(255))
+    # queued -> running -> done | failed
+    status = Column(String(20), default="queued", nullable=False, index=True)
+    pages_done = Column(Integer, default=0, nullable=False)
+    pages_total = Column(Integer)
+    # JSON-encoded OCR options (DPI, page range, language, ...)
+    options = Column(Text)
+    # The uploaded PDF, kept only until the job finishes
+    payload = deferred(Column(LargeBinary))
+    result_text = Column(Text)
+    error = Column(Text)
+    created_at = Column(DateTime(timezone=True), default=_utcnow, nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow, nullable=False)
+
+class KeywordSet(Base):
+    __tablename__ = "keyword_sets"
+
+    id = Column(String(64), primary_key=True, index=True)
+    client_id = Column(String(255), index=True, nullable=False)
+    name = Column(String(255), nullable=False)
+    # SHA-256 of the sorted, de-duplicated keywords; also the compiled automaton's cache key
+    digest = Column(String(64), index=True, nullable=False)
+    keyword_count = Column(Integer, nullable=False)
+    # JSON-encoded keyword list, only read when the automaton has to be recompiled
+    keywords = deferred(Column(Text, nullable=False))
+    created_at = Column(DateTime(timezone=True), default=_utcnow, nullable=False)
+
+class Document(Base):
+    __tablename__ = "documents"
+
+    id = Column(String(64), primary_key=True, index=True)
+    client_id = Column(String(255), index=True, nullable=False)
+    filename = Column(String(255))
+    sha256 = Column(String(64), index=True, nullable=False)
+    # How the text was obtained: extract, ocr or hybrid
+    method = Column(String(20), nullable=False)
+    page_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), default=_utcnow, nullable=False)
+
+class DocumentPage(Base):
+    __tablename__ = "document_pages"
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(String(64), ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    # Copied from the document so searches can filter by owner without a join
+    client_id = Column(String(255), index=True, nullable=False)
+    page_number = Column(Integer, nullable=False)
+    text = Column(Text, nullable=False)
+
+class UsageRecord(Base):
+    __tablename__ = "usage_records"
+    __table_args__ = (UniqueConstraint("client_id", "bucket_start", name="uq_usage_client_bucket"),)
+
+    id = Column(Integer, primary_key=True)
+    client_id = Column(String(255), index=True, nullable=False)
+    # Start of the aggregation period (METERING_BUCKET_SECONDS long), UTC
+    bucket_start = Column(DateTime(timezone=True), index=True, nullable=False)
+    requests = Column(Integer, default=0, nullable=False)
+    bytes_uploaded = Column(BigInteger, default=0, nullable=False)
+    pages = Column(Integer, default=0, nullable=False)
+    ocr_seconds = Column(Float, default=0.0, nullable=False)
+    detect_calls = Column(Integer, default=0, nullable=False)
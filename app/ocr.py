@@ -0,0 +1,286 @@
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+
+from . import process_pool
+
+# --- OCR Worker Pool Settings ---
+# Number of worker processes used to OCR pages in parallel. Defaults to one per core.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "0")) or os.cpu_count() or 1
+# Pages submitted to the pool ahead of the one being returned. Keeps every worker busy
+# while holding only this many pages' results in memory.
+OCR_LOOKAHEAD = int(os.getenv("OCR_LOOKAHEAD", "0")) or 2 * OCR_WORKERS
+# In hybrid mode, pages whose text layer has fewer characters than this are OCR'd
+HYBRID_MIN_CHARS = int(os.getenv("HYBRID_MIN_CHARS", "20"))
+# OCR engine: "tesserocr" (persistent in-process API), "pytesseract" (one tesseract
+# subprocess per page) or "auto" (tesserocr if installed, otherwise pytesseract)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+TESSDATA_PREFIX = os.getenv("TESSDATA_PREFIX")
+# -------------------------------------
+
+# Defaults for the per-request rasterization and tesseract options
+DEFAULT_OPTIONS = {
+    "dpi": 300,
+    "grayscale": True,
+    "binarize_threshold": None,  # 0-255; pixels above it become white, the rest black
+    "first_page": None,
+    "last_page": None,
+    "lang": "eng",
+    "psm": None,  # tesseract page segmentation mode
+}
+
+logger = logging.getLogger(__name__)
+
+_pool = process_pool.ProcessPool("OCR", OCR_WORKERS)
+
+def get_pool() -> ProcessPoolExecutor:
+    """Returns the shared OCR process pool, creating it on first use or after it broke."""
+    return _pool.get()
+
+def shutdown_pool():
+    """Stops the OCR worker processes. Called when the application shuts down."""
+    _pool.shutdown()
+
+def resolve_options(options: Optional[dict] = None) -> dict:
+    """Fills in defaults for any OCR options the request did not set."""
+    return {**DEFAULT_OPTIONS, **{key: value for key, value in (options or {}).items() if value is not None}}
+
+# --- OCR Backends ---
+
+class PytesseractBackend:
+    """Runs the tesseract binary once per page. Kept as the fallback backend."""
+    name = "pytesseract"
+
+    def image_to_string(self, image: Image.Image, lang: str, psm: Optional[int]) -> str:
+        config = f"--psm {psm}" if psm is not None else ""
+        return pytesseract.image_to_string(image, lang=lang, config=config)
+
+class TesserocrBackend:
+    """
+    Keeps tesseract API handles alive for the life of the worker process, so the
+    language model is loaded once and images are passed in memory without temp files.
+    """
+    name = "tesserocr"
+    # Handles are kept per (lang, psm); only a few combinations are expected
+    MAX_HANDLES = 4
+
+    def __init__(self):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self._apis = {}
+
+    def _api(self, lang: str, psm: Optional[int]):
+        key = (lang, psm)
+        api = self._apis.get(key)
+        if api is None:
+            if len(self._apis) >= self.MAX_HANDLES:
+                self._apis.pop(next(iter(self._apis))).End()
+            kwargs = {"lang": lang}
+            if psm is not None:
+                kwargs["psm"] = psm
+            if TESSDATA_PREFIX:
+                kwargs["path"] = TESSDATA_PREFIX
+            api = self._tesserocr.PyTessBaseAPI(**kwargs)
+            self._apis[key] = api
+        return api
+
+    def image_to_string(self, image: Image.Image, lang: str, psm: Optional[int]) -> str:
+        api = self._api(lang, psm)
+        api.SetImage(image)
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+def create_backend(name: str = OCR_BACKEND):
+    """Creates the named OCR backend, falling back to pytesseract in "auto" mode."""
+    if name == "pytesseract":
+        return PytesseractBackend()
+    if name == "tesserocr":
+        return TesserocrBackend()
+    try:
+        backend = TesserocrBackend()
+        # Handles are created lazily, so open the default one now: a missing or bad
+        # tessdata path would otherwise only fail once a page reaches the worker
+        backend._api(DEFAULT_OPTIONS["lang"], DEFAULT_OPTIONS["psm"])
+        return backend
+    except (ImportError, RuntimeError, OSError) as e:
+        logger.warning("tesserocr backend unavailable (%s); using pytesseract", e)
+        return PytesseractBackend()
+
+# --- Worker process side ---
+
+_worker_backend = None
+
+def get_backend():
+    """Returns this process's OCR backend, creating it on first use."""
+    global _worker_backend
+    if _worker_backend is None:
+        _worker_backend = create_backend()
+    return _worker_backend
+
+# Each worker keeps the document it last rendered open, since consecutive tasks
+# usually come from the same upload.
+_worker_doc: Optional[fitz.Document] = None
+_worker_doc_id: Optional[tuple] = None
+
+def _open_worker_doc(pdf_path: str) -> fitz.Document:
+    global _worker_doc, _worker_doc_id
+    # Temp paths can be reused, so identify the file by inode and mtime too
+    stat = os.stat(pdf_path)
+    doc_id = (pdf_path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if _worker_doc_id != doc_id:
+        if _worker_doc is not None:
+            _worker_doc.close()
+        _worker_doc = fitz.open(pdf_path)
+        _worker_doc_id = doc_id
+    return _worker_doc
+
+def rasterize_page(doc: fitz.Document, page_number: int, options: dict) -> Image.Image:
+    """Renders a single page (1-based) in-process and applies the requested preprocessing."""
+    grayscale = options["grayscale"] or options["binarize_threshold"] is not None
+    pix = doc[page_number - 1].get_pixmap(
+        dpi=options["dpi"], colorspace=fitz.csGRAY if grayscale else fitz.csRGB, alpha=False
+    )
+    image = Image.frombytes("L" if grayscale else "RGB", (pix.width, pix.height), pix.samples)
+    threshold = options["binarize_threshold"]
+    if threshold is not None:
+        image = image.point(lambda value: 255 if value > threshold else 0, mode="1")
+    return image
+
+@process_pool.portable_errors
+def _ocr_page(pdf_path: str, page_number: int, options: dict) -> Tuple[str, float]:
+    """
+    Runs in a worker process: rasterizes a single page (1-based) and OCRs it.
+    Returns the text and the seconds of worker time it took.
+    """
+    start = time.perf_counter()
+    image = rasterize_page(_open_worker_doc(pdf_path), page_number, options)
+    text = get_backend().image_to_string(image, options["lang"], options["psm"])
+    return text, time.perf_counter() - start
+
+# --- Request side ---
+
+def count_pages(pdf_bytes: bytes) -> int:
+    """Returns the number of pages in a PDF without rasterizing it."""
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+def page_range(page_count: int, options: Optional[dict] = None) -> range:
+    """
+    Returns the 1-based page numbers selected by the first_page/last_page options.
+    last_page is clamped to the document; a range selecting no pages raises ValueError.
+    """
+    options = resolve_options(options)
+    first = max(options["first_page"] or 1, 1)
+    last = min(options["last_page"] or page_count, page_count)
+    if options["last_page"] is not None and first > options["last_page"]:
+        raise ValueError(f"first_page ({first}) is after last_page ({options['last_page']}).")
+    if first > page_count:
+        raise ValueError(f"first_page ({first}) is past the end of the document ({page_count} pages).")
+    return range(first, last + 1)
+
+def iter_ocr_pages(
+    pdf_bytes: bytes,
+    page_numbers: Optional[List[int]] = None,
+    options: Optional[dict] = None,
+    on_page_seconds: Optional[Callable[[float], None]] = None,
+) -> Iterator[str]:
+    """
+    OCRs the given pages (1-based, default the requested page range) across the worker
+    pool, yielding each page's text in order. on_page_seconds, if given, is called with
+    the worker time spent on each page (used for usage metering).
+    """
+    options = resolve_options(options)
+    if page_numbers is None:
+        page_numbers = page_range(count_pages(pdf_bytes), options)
+    for _, text in _iter_pages(pdf_bytes, ((number, None) for number in page_numbers), options, on_page_seconds):
+        yield text
+
+def _iter_pages(
+    pdf_bytes: bytes,
+    pages: Iterator[Tuple[int, Optional[str]]],
+    options: dict,
+    on_page_seconds: Optional[Callable[[float], None]],
+) -> Iterator[Tuple[str, str]]:
+    """
+    Takes (page number, text or None) pairs and yields (method, text) in the same order,
+    OCRing the pages that have no text on the worker pool. Pages are pulled from the input
+    only as they are needed to keep OCR_LOOKAHEAD pages ahead of the output. The PDF is
+    written to a temporary file the first time a page needs OCR, so workers only receive
+    its path.
+    """
+    pending = deque()  # ("text", text) or ("ocr", future), in page order
+    pdf_path = None
+    pool = None
+
+    def take():
+        method, value = pending.popleft()
+        if method == "text":
+            return method, value
+        text, seconds = value.result()
+        if on_page_seconds is not None:
+            on_page_seconds(seconds)
+        return method, text
+
+    try:
+        for number, text in pages:
+            if text is None:
+                if pdf_path is None:
+                    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+                    with os.fdopen(fd, "wb") as tmp:
+                        tmp.write(pdf_bytes)
+                    pool = get_pool()
+                pending.append(("ocr", pool.submit(_ocr_page, pdf_path, number, options)))
+            else:
+                pending.append(("text", text))
+            # Text pages go out as soon as every page before them has
+            while pending and (pending[0][0] == "text" or len(pending) > OCR_LOOKAHEAD):
+                yield take()
+        while pending:
+            yield take()
+    except BrokenProcessPool:
+        # A worker died; this request fails, the next one gets a new pool
+        _pool.discard(pool)
+        raise
+    finally:
+        for method, value in pending:
+            if method == "ocr":
+                value.cancel()
+        if pdf_path is not None:
+            os.remove(pdf_path)
+
+def iter_hybrid_pages(
+    pdf_bytes: bytes,
+    min_chars: int = HYBRID_MIN_CHARS,
+    options: Optional[dict] = None,
+    on_page_seconds: Optional[Callable[[float], None]] = None,
+) -> Iterator[Dict[str, str]]:
+    """
+    Uses each page's text layer when it has at least min_chars characters and OCRs
+    only the remaining pages. Yields {"method": "text" | "ocr", "text": ...} in page order.
+    Each page's text layer is read as it is reached, and low-text pages are sent to the
+    OCR pool then, so only the pages in flight are held in memory.
+    """
+    options = resolve_options(options)
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        def text_layer():
+            for number in page_range(doc.page_count, options):
+                text = doc[number - 1].get_text()
+                yield number, (text if len(text.strip()) >= min_chars else None)
+
+        pages = _iter_pages(pdf_bytes, text_layer(), options, on_page_seconds)
+        try:
+            for method, text in pages:
+                yield {"method": method, "text": text}
+        finally:
+            pages.close()
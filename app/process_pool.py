@@ -0,0 +1,65 @@
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# --- Process Pool Settings ---
+# How worker processes are started. Pools are created lazily from a process that is
+# already running threads, where "fork" can copy held locks, so they default to forkserver.
+PROCESS_START_METHOD = os.getenv("PROCESS_START_METHOD", "forkserver")
+# -------------------------------------
+
+logger = logging.getLogger(__name__)
+
+class ProcessPool:
+    """
+    A ProcessPoolExecutor created on first use and replaced once it breaks. A worker that
+    dies (e.g. killed for running out of memory) breaks the whole executor; callers that
+    get BrokenProcessPool pass it to discard() so the next call starts a fresh one.
+    """
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def get(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD)
+                )
+            return self._executor
+
+    def discard(self, executor: ProcessPoolExecutor):
+        """Drops a broken executor, unless another caller already replaced it."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+        logger.warning("The %s process pool broke; starting a new one for the next request", self.name)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+def portable_errors(fn):
+    """
+    Wraps a worker function so any exception it raises reaches the parent as a plain
+    RuntimeError. Exceptions that can't be unpickled (e.g. pytesseract's
+    TesseractNotFoundError) would otherwise break the whole pool. functools.wraps keeps
+    the original name, so the wrapped module-level function still pickles by reference.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            raise RuntimeError(f"{type(e).__name__}: {e}") from None
+    return wrapper
@@ -0,0 +1,281 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from . import crud, database, metering, models, security
+
+# --- Quota Settings ---
+# Per-tier limits: a token bucket of requests ("rate" per second, up to "burst"),
+# concurrent heavy requests, outstanding OCR jobs, and daily upload byte/page budgets.
+TIER_QUOTAS = {
+    "freemium": {
+        "rate": float(os.getenv("FREEMIUM_RATE_PER_SECOND", "5")),
+        "burst": int(os.getenv("FREEMIUM_BURST", "20")),
+        "concurrent": int(os.getenv("FREEMIUM_CONCURRENT_JOBS", "2")),
+        "queued_jobs": int(os.getenv("FREEMIUM_QUEUED_JOBS", "2")),
+        "daily_bytes": int(os.getenv("FREEMIUM_DAILY_BYTES", str(500 * 1024 * 1024))),  # 500 MB
+        "daily_pages": int(os.getenv("FREEMIUM_DAILY_PAGES", "5000")),
+    },
+    "exclusive": {
+        "rate": float(os.getenv("EXCLUSIVE_RATE_PER_SECOND", "50")),
+        "burst": int(os.getenv("EXCLUSIVE_BURST", "100")),
+        "concurrent": int(os.getenv("EXCLUSIVE_CONCURRENT_JOBS", "8")),
+        "queued_jobs": int(os.getenv("EXCLUSIVE_QUEUED_JOBS", "20")),
+        "daily_bytes": int(os.getenv("EXCLUSIVE_DAILY_BYTES", str(20 * 1024 * 1024 * 1024))),  # 20 GB
+        "daily_pages": int(os.getenv("EXCLUSIVE_DAILY_PAGES", "200000")),
+    },
+}
+QUOTAS_ENABLED = os.getenv("QUOTAS_ENABLED", "true").lower() in ("1", "true", "yes")
+# "memory" keeps counters per process; "redis" shares them across workers (needs the redis package)
+QUOTA_BACKEND = os.getenv("QUOTA_BACKEND", "memory")
+QUOTA_REDIS_URL = os.getenv("QUOTA_REDIS_URL", "redis://localhost:6379/0")
+# A concurrency slot is dropped after this long even if its release was lost (e.g. a crashed worker)
+QUOTA_SLOT_TTL_SECONDS = int(os.getenv("QUOTA_SLOT_TTL_SECONDS", "3600"))
+# -------------------------------------
+
+DAY_SECONDS = 24 * 60 * 60
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+def _seconds_until_midnight() -> int:
+    return DAY_SECONDS - int(time.time()) % DAY_SECONDS
+
+# --- Backends ---
+
+class MemoryBackend:
+    """Quota counters for a single process."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, updated_at)
+        self._slots: Dict[str, int] = {}
+        self._usage: Dict[str, int] = {}
+        self._usage_day = _today()
+
+    async def take_token(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Takes one token from a bucket refilling at rate per second up to burst. Returns (allowed, tokens left)."""
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        with self._lock:
+            if self._slots.get(key, 0) >= limit:
+                return False
+            self._slots[key] = self._slots.get(key, 0) + 1
+            return True
+
+    async def release_slot(self, key: str):
+        with self._lock:
+            count = self._slots.get(key, 0) - 1
+            if count > 0:
+                self._slots[key] = count
+            else:
+                self._slots.pop(key, None)
+
+    async def add_usage(self, key: str, amount: int, limit: int) -> Tuple[bool, int]:
+        """Adds amount to today's usage unless it would go over limit. Returns (allowed, used)."""
+        with self._lock:
+            if self._usage_day != _today():
+                self._usage.clear()
+                self._usage_day = _today()
+            used = self._usage.get(key, 0)
+            if used + amount > limit:
+                return False, used
+            self._usage[key] = used + amount
+            return True, used + amount
+
+# Token bucket: KEYS[1] bucket; ARGV rate, burst, now. Returns {allowed, tokens * 1000}
+_TOKEN_BUCKET_LUA = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or burst
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(now - updated_at, 0) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, math.floor(tokens * 1000)}
+"""
+
+# Slot release: KEYS[1] counter. Decrements, but never below zero (e.g. after the key expired)
+_RELEASE_SLOT_LUA = """
+local value = tonumber(redis.call('GET', KEYS[1]) or '0')
+if value > 0 then
+  return redis.call('DECR', KEYS[1])
+end
+return 0
+"""
+
+# Bounded counter: KEYS[1] counter; ARGV amount, limit, ttl. Returns {allowed, value}
+_BOUNDED_INCR_LUA = """
+local value = tonumber(redis.call('GET', KEYS[1]) or '0')
+if value + tonumber(ARGV[1]) > tonumber(ARGV[2]) then
+  return {0, value}
+end
+value = redis.call('INCRBY', KEYS[1], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return {1, value}
+"""
+
+class RedisBackend:
+    """Quota counters shared by every worker through Redis; each check is one atomic script."""
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._token_bucket = self._redis.register_script(_TOKEN_BUCKET_LUA)
+        self._bounded_incr = self._redis.register_script(_BOUNDED_INCR_LUA)
+        self._release_slot = self._redis.register_script(_RELEASE_SLOT_LUA)
+
+    async def take_token(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        allowed, tokens = await self._token_bucket(keys=[f"quota:bucket:{key}"], args=[rate, burst, time.time()])
+        return bool(allowed), tokens / 1000
+
+    async def acquire_slot(self, key: str, limit: int) -> bool:
+        allowed, _ = await self._bounded_incr(keys=[f"quota:slots:{key}"], args=[1, limit, QUOTA_SLOT_TTL_SECONDS])
+        return bool(allowed)
+
+    async def release_slot(self, key: str):
+        await self._release_slot(keys=[f"quota:slots:{key}"])
+
+    async def add_usage(self, key: str, amount: int, limit: int) -> Tuple[bool, int]:
+        allowed, used = await self._bounded_incr(
+            keys=[f"quota:usage:{_today()}:{key}"], args=[amount, limit, 2 * DAY_SECONDS]
+        )
+        return bool(allowed), int(used)
+
+def create_backend(name: str = QUOTA_BACKEND):
+    if name == "redis":
+        return RedisBackend(QUOTA_REDIS_URL)
+    return MemoryBackend()
+
+backend = create_backend()
+
+# --- Dependencies ---
+
+def _too_many(detail: str, retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(retry_after, 1))},
+    )
+
+def enforce(heavy: bool = False, required_tier: Optional[str] = None):
+    """
+    A dependency factory applying the caller's tier quotas to an endpoint: the request
+    rate always, and a concurrency slot for heavy endpoints (held until the response has
+    been sent). With required_tier, the rate-limit token is taken before the tier is
+    re-checked against the database, so refused callers can't query it unmetered, and the
+    slot only once the tier is confirmed. Upload bytes are charged by the endpoint once the
+    upload is validated (charge_bytes).
+    """
+    async def quota_checker(request: Request, current_client: models.Client = Depends(security.get_current_client),
+                            db: crud.AnySession = Depends(database.get_async_db)):
+        if QUOTAS_ENABLED:
+            await _check_rate(request, current_client)
+        if required_tier:
+            current_client = await security.check_tier(current_client, required_tier, db)
+        if QUOTAS_ENABLED and heavy:
+            await _acquire_slot(request, current_client)
+        metering.record(current_client.client_id, requests=1)
+    return quota_checker
+
+async def _check_rate(request: Request, current_client: models.Client):
+    """Takes a token from the client's request-rate bucket, raising 429 if it is empty."""
+    quotas = TIER_QUOTAS[current_client.tier]
+    client_id = current_client.client_id
+    allowed, tokens = await backend.take_token(client_id, quotas["rate"], quotas["burst"])
+    # Reset is when the bucket is full again
+    request.state.rate_limit = {
+        "limit": quotas["burst"], "remaining": int(tokens), "reset": (quotas["burst"] - tokens) / quotas["rate"]
+    }
+    if not allowed:
+        raise _too_many(f"Rate limit exceeded for the {current_client.tier} tier.", math.ceil((1 - tokens) / quotas["rate"]))
+
+async def _acquire_slot(request: Request, current_client: models.Client):
+    """Takes one of the client's concurrency slots for a heavy request, raising 429 if none is free."""
+    quotas = TIER_QUOTAS[current_client.tier]
+    client_id = current_client.client_id
+    if not await backend.acquire_slot(client_id, quotas["concurrent"]):
+        raise _too_many(
+            f"Too many concurrent requests; the {current_client.tier} tier allows {quotas['concurrent']}.", 1
+        )
+    # Released by QuotaMiddleware once the response, including any stream, is done
+    request.state.quota_slots = getattr(request.state, "quota_slots", []) + [client_id]
+
+async def charge_bytes(current_client: models.Client, size: int):
+    """Counts a validated upload against the client's daily byte budget, raising 429 if it is used up."""
+    if size <= 0:
+        return
+    if QUOTAS_ENABLED:
+        limit = TIER_QUOTAS[current_client.tier]["daily_bytes"]
+        allowed, _ = await backend.add_usage(f"{current_client.client_id}:bytes", size, limit)
+        if not allowed:
+            raise _too_many(f"Daily upload budget exhausted for the {current_client.tier} tier.", _seconds_until_midnight())
+    metering.record(current_client.client_id, bytes_uploaded=size)
+
+async def charge_pages(current_client: models.Client, pages: int):
+    """Counts pages against the client's daily page budget, raising 429 if it is used up."""
+    if pages <= 0:
+        return
+    if QUOTAS_ENABLED:
+        limit = TIER_QUOTAS[current_client.tier]["daily_pages"]
+        allowed, _ = await backend.add_usage(f"{current_client.client_id}:pages", pages, limit)
+        if not allowed:
+            raise _too_many(f"Daily page budget of {limit} pages exhausted for the {current_client.tier} tier.", _seconds_until_midnight())
+    metering.record(current_client.client_id, pages=pages)
+
+def check_queued_jobs(current_client: models.Client, active_jobs: int):
+    """Raises 429 if the client already has as many queued or running jobs as its tier allows."""
+    limit = TIER_QUOTAS[current_client.tier]["queued_jobs"]
+    if QUOTAS_ENABLED and active_jobs >= limit:
+        raise _too_many(f"Too many unfinished jobs; the {current_client.tier} tier allows {limit}.", 5)
+
+# --- Middleware ---
+
+class QuotaMiddleware:
+    """
+    Adds X-RateLimit-* headers to every rate-limited response and releases the
+    concurrency slots a request holds after its response has been fully sent.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = scope.setdefault("state", {})
+
+        async def send_with_headers(message):
+            rate_limit = state.get("rate_limit")
+            if message["type"] == "http.response.start" and rate_limit:
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [
+                    (b"x-ratelimit-limit", str(rate_limit["limit"]).encode()),
+                    (b"x-ratelimit-remaining", str(rate_limit["remaining"]).encode()),
+                    (b"x-ratelimit-reset", str(math.ceil(rate_limit["reset"])).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            slots: List[str] = state.get("quota_slots", [])
+            for key in slots:
+                await backend.release_slot(key)
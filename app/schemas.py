@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
+from datetime import datetime
 
 # Schema for creating a new client
 class ClientCreate(BaseModel):
@@ -21,6 +22,14 @@ class Client(ClientCreate):
     class Config:
         from_attributes = True
 
+# The authenticated caller, as resolved from the access token (and cached)
+class AuthenticatedClient(BaseModel):
+    client_id: str
+    tier: str
+
+    class Config:
+        from_attributes = True
+
 # Schema for the JWT token response
 class Token(BaseModel):
     access_token: str
@@ -36,6 +45,92 @@ class TokenRequestForm(BaseModel):
 class UpgradeResponse(BaseModel):
     message: str
     client: Client
+    # A fresh token carrying the new tier; older tokens still say the previous one
+    access_token: Optional[str] = None
 
 class DetectRequest(BaseModel):
-    text: str
\ No newline at end of file
+    text: str
+
+class DetectBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+
+# Rasterization and tesseract options for the OCR endpoints
+OCR_LANG_PATTERN = r"^[A-Za-z0-9_]+(\+[A-Za-z0-9_]+)*$"
+
+class OcrOptions(BaseModel):
+    dpi: int = Field(300, ge=72, le=600)
+    grayscale: bool = True
+    binarize_threshold: Optional[int] = Field(None, ge=0, le=255)
+    first_page: Optional[int] = Field(None, ge=1)
+    last_page: Optional[int] = Field(None, ge=1)
+    lang: str = Field("eng", pattern=OCR_LANG_PATTERN)
+    psm: Optional[int] = Field(None, ge=0, le=13)
+
+# Schemas for the asynchronous OCR job API
+class OcrJobInfo(BaseModel):
+    job_id: str
+    filename: Optional[str] = None
+    status: str
+    pages_done: int
+    pages_total: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class OcrJobResult(BaseModel):
+    job_id: str
+    filename: Optional[str] = None
+    ocr_text: str
+
+# Schemas for registered keyword sets used by /search-text/
+class KeywordSetCreate(BaseModel):
+    name: str
+    keywords: List[str] = Field(..., min_length=1)
+
+class KeywordSetInfo(BaseModel):
+    keyword_set_id: str
+    name: str
+    keyword_count: int
+    digest: str
+    created_at: datetime
+
+# Schemas for the document store
+class DocumentInfo(BaseModel):
+    document_id: str
+    filename: Optional[str] = None
+    sha256: str
+    method: str
+    page_count: int
+    created_at: datetime
+
+class DocumentSearchHit(BaseModel):
+    document_id: str
+    filename: Optional[str] = None
+    page: int
+    snippet: str
+
+class DocumentSearchResult(BaseModel):
+    query: str
+    limit: int
+    offset: int
+    has_more: bool
+    hits: List[DocumentSearchHit]
+
+# Schemas for the usage report
+class UsageCounts(BaseModel):
+    requests: int = 0
+    bytes_uploaded: int = 0
+    pages: int = 0
+    ocr_seconds: float = 0.0
+    detect_calls: int = 0
+
+class UsageBucket(UsageCounts):
+    bucket_start: datetime
+
+class UsageReport(BaseModel):
+    client_id: str
+    bucket_seconds: int
+    start: datetime
+    end: datetime
+    totals: UsageCounts
+    buckets: List[UsageBucket]
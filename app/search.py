@@ -0,0 +1,209 @@
+import codecs
+import os
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import ahocorasick
+
+from .automata import fold_case
+
+# --- Streaming Search Settings ---
+# Uploads are decoded and scanned this many bytes at a time.
+SEARCH_CHUNK_BYTES = int(os.getenv("SEARCH_CHUNK_BYTES", str(1024 * 1024)))  # 1 MB
+# -------------------------------------
+
+# all: one {"keyword", "start_index", "end_index"} dict per match
+# count: per-keyword totals; first: first match per keyword
+# positions: parallel arrays of keyword index, start and end offsets
+MATCH_MODE_PATTERN = "^(all|count|first|positions)$"
+
+# A match is (keyword, start_index, end_index, page), offsets inclusive; page is None for text files
+Match = Tuple[str, int, int, Optional[int]]
+
+def _longest_keyword(A: ahocorasick.Automaton) -> int:
+    return A.get_stats()["longest_word"]
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+def _scan(A: ahocorasick.Automaton, text: str, scanned: str, whole_word: bool) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yields (keyword, start, end) for every match of the automaton in scanned, which is
+    text itself or its case-folded form. Whole-word checks look at the original text.
+    A case-insensitive match yields once for each keyword folding to the matched text.
+    """
+    for end, value in A.iter(scanned):
+        keywords = value if isinstance(value, tuple) else (value,)
+        start = end - len(keywords[0]) + 1
+        if whole_word and (
+            (start > 0 and _is_word_char(text[start - 1]))
+            or (end + 1 < len(text) and _is_word_char(text[end + 1]))
+        ):
+            continue
+        for keyword in keywords:
+            yield keyword, start, end
+
+def iter_match_chunks(
+    A: ahocorasick.Automaton,
+    fileobj: BinaryIO,
+    case_insensitive: bool = False,
+    whole_word: bool = False,
+    chunk_bytes: int = SEARCH_CHUNK_BYTES,
+) -> Iterator[List[Match]]:
+    """
+    Scans a UTF-8 file chunk by chunk, yielding the matches found in each chunk.
+
+    The last (longest keyword + 1) characters of each chunk are carried into the next
+    scan so matches spanning a boundary are found, and the character before a match
+    is available for whole-word checks. The final character of a non-final chunk is
+    left for the next scan, where the character after it is known. Each match is
+    reported exactly once, with character offsets into the whole decoded file.
+    The automaton must have been built with the same case_insensitive setting.
+    Raises UnicodeDecodeError on invalid UTF-8.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    carry = _longest_keyword(A) + 1
+    tail = ""
+    tail_start = 0  # offset of tail[0] within the whole text
+    reported_upto = 0  # matches ending before this offset were already reported
+    while True:
+        raw = fileobj.read(chunk_bytes)
+        final = not raw
+        buffer = tail + decoder.decode(raw, final=final)
+        scanned = fold_case(buffer) if case_insensitive else buffer
+        limit = len(buffer) if final else len(buffer) - 1
+        matches = [
+            (keyword, tail_start + start, tail_start + end, None)
+            for keyword, start, end in _scan(A, buffer, scanned, whole_word)
+            if end < limit and tail_start + end >= reported_upto
+        ]
+        if matches:
+            yield matches
+        if final:
+            return
+        reported_upto = tail_start + max(limit, 0)
+        keep = min(carry, len(buffer))
+        tail_start += len(buffer) - keep
+        tail = buffer[len(buffer) - keep:]
+
+def iter_page_match_chunks(
+    A: ahocorasick.Automaton,
+    pages: Iterable[Union[str, dict]],
+    case_insensitive: bool = False,
+    whole_word: bool = False,
+    stats: Optional[dict] = None,
+) -> Iterator[List[Match]]:
+    """
+    Scans a document page by page, yielding each page's matches with offsets within
+    that page. A page is its text, or a dict with "text" and "method" (as produced in
+    hybrid mode). If given, stats receives the page count and the pages that were OCR'd.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(pages=0, ocr_pages=[])
+    for number, page in enumerate(pages, start=1):
+        text = page["text"] if isinstance(page, dict) else page
+        stats["pages"] = number
+        if isinstance(page, dict) and page.get("method") == "ocr":
+            stats["ocr_pages"].append(number)
+        scanned = fold_case(text) if case_insensitive else text
+        matches = [(keyword, start, end, number) for keyword, start, end in _scan(A, text, scanned, whole_word)]
+        if matches:
+            yield matches
+
+# --- Result shapes ---
+
+def _match_dict(keyword: str, start: int, end: int, page: Optional[int]) -> dict:
+    if page is None:
+        return {"keyword": keyword, "start_index": start, "end_index": end}
+    return {"page": page, "keyword": keyword, "start_index": start, "end_index": end}
+
+def _all(batches: Iterable[List[Match]]) -> List[dict]:
+    return [_match_dict(*match) for matches in batches for match in matches]
+
+def _count(batches: Iterable[List[Match]]) -> dict:
+    counts: Dict[str, int] = {}
+    for matches in batches:
+        for keyword, _, _, _ in matches:
+            counts[keyword] = counts.get(keyword, 0) + 1
+    return {"counts": counts, "total": sum(counts.values())}
+
+def _first(batches: Iterable[List[Match]]) -> dict:
+    first: Dict[str, dict] = {}
+    for matches in batches:
+        for keyword, start, end, page in matches:
+            if keyword not in first:
+                match = _match_dict(keyword, start, end, page)
+                del match["keyword"]
+                first[keyword] = match
+    return first
+
+def _positions(batches: Iterable[List[Match]]) -> dict:
+    keywords: Dict[str, int] = {}
+    keyword_index, starts, ends, pages = [], [], [], []
+    for matches in batches:
+        for keyword, start, end, page in matches:
+            keyword_index.append(keywords.setdefault(keyword, len(keywords)))
+            starts.append(start)
+            ends.append(end)
+            pages.append(page)
+    positions = {"keywords": list(keywords), "keyword_index": keyword_index, "start_index": starts, "end_index": ends}
+    if any(page is not None for page in pages):
+        positions["page"] = pages
+    return positions
+
+_COLLECTORS = {"all": _all, "count": _count, "first": _first, "positions": _positions}
+
+def collect(batches: Iterable[List[Match]], match_mode: str = "all"):
+    """Shapes a stream of match batches into the response for the given match mode."""
+    return _COLLECTORS[match_mode](batches)
+
+def find_all(A: ahocorasick.Automaton, fileobj: BinaryIO, match_mode: str = "all",
+             case_insensitive: bool = False, whole_word: bool = False):
+    """Scans a UTF-8 file in chunks and returns its matches shaped for the match mode."""
+    return collect(iter_match_chunks(A, fileobj, case_insensitive, whole_word), match_mode)
+
+def iter_match_records(A: ahocorasick.Automaton, fileobj: BinaryIO, match_mode: str = "all",
+                       case_insensitive: bool = False, whole_word: bool = False) -> Iterator[List[dict]]:
+    """
+    Yields batches of match records as they are found, then a final summary record.
+    In the aggregated modes, the result is carried by the summary record instead.
+    Closes the file when done.
+    """
+    try:
+        batches = iter_match_chunks(A, fileobj, case_insensitive, whole_word)
+        if match_mode != "all":
+            yield [{"done": True, "found_keywords": collect(batches, match_mode)}]
+            return
+        count = 0
+        for matches in batches:
+            count += len(matches)
+            yield _all([matches])
+        yield [{"done": True, "matches": count}]
+    finally:
+        fileobj.close()
+
+def find_in_pages(A: ahocorasick.Automaton, pages: Iterable[Union[str, dict]], match_mode: str = "all",
+                  case_insensitive: bool = False, whole_word: bool = False) -> Tuple[object, dict]:
+    """Scans a document page by page; returns the shaped matches and the page stats."""
+    stats: dict = {}
+    found_keywords = collect(iter_page_match_chunks(A, pages, case_insensitive, whole_word, stats), match_mode)
+    return found_keywords, stats
+
+def iter_page_match_records(A: ahocorasick.Automaton, pages: Iterable[Union[str, dict]], match_mode: str = "all",
+                            case_insensitive: bool = False, whole_word: bool = False) -> Iterator[List[dict]]:
+    """
+    Yields batches of match records page by page, then a final summary record with the
+    page count and OCR'd pages. In the aggregated modes, the result is carried by the
+    summary record instead.
+    """
+    stats: dict = {}
+    batches = iter_page_match_chunks(A, pages, case_insensitive, whole_word, stats)
+    if match_mode != "all":
+        found_keywords = collect(batches, match_mode)
+        yield [{"done": True, **stats, "found_keywords": found_keywords}]
+        return
+    count = 0
+    for matches in batches:
+        count += len(matches)
+        yield _all([matches])
+    yield [{"done": True, **stats, "matches": count}]
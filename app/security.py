@@ -1,17 +1,21 @@
 import os
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from sqlalchemy.orm import Session
 
-from . import crud, models, database
+from . import crud, models, schemas, database, hashing, metrics
+from .client_cache import client_cache
 
 SECRET_KEY = os.getenv("SECRET_KEY", "a_default_secret_key_for_development")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Look the client up in the database on every request instead of trusting the
+# token's tier claim and the in-process client cache
+AUTH_STRICT_DB = os.getenv("AUTH_STRICT_DB", "false").lower() in ("1", "true", "yes")
 
 # Point the tokenUrl to the new endpoint
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/oauth/token")
@@ -26,38 +30,93 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_client(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
-    """
-    Dependency to get the current client from a JWT token.
-    This protects endpoints by ensuring a valid client token is provided.
-    """
-    credentials_exception = HTTPException(
+async def authenticate_client(db: crud.AnySession, client_id: str, client_secret: str):
+    """Authenticates a client by checking its ID and secret; bcrypt runs off the request thread."""
+    db_client = await crud.get_client_by_id_async(db, client_id)
+    if not db_client:
+        return None
+    stored_hash = db_client.client_secret_hash
+    client = schemas.AuthenticatedClient.model_validate(db_client)
+    # Don't hold a pooled connection while bcrypt runs
+    await crud.release_connection(db)
+    if not await hashing.verify_secret(client_id, client_secret, stored_hash):
+        return None
+    return client
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+async def load_client(db: crud.AnySession, client_id: str) -> schemas.AuthenticatedClient:
+    """Reads a client from the database and refreshes its cache entry."""
+    with metrics.stage("auth_db"):
+        db_client = await crud.get_client_by_id_async(db, client_id)
+        client = schemas.AuthenticatedClient.model_validate(db_client) if db_client is not None else None
+        # Auth only needs this one row; return the connection rather than hold it for the whole request
+        await crud.release_connection(db)
+    if client is None:
+        raise _credentials_exception()
+    client_cache.put(client)
+    return client
+
+async def get_current_client(token: str = Depends(oauth2_scheme), db: crud.AnySession = Depends(database.get_async_db)):
+    """
+    Dependency to get the current client from a JWT token.
+    This protects endpoints by ensuring a valid client token is provided.
+    The client comes from the in-process cache, then the token's signed tier claim,
+    and only then the database, so the common case runs no queries.
+    """
+    with metrics.stage("auth"):
+        return await _resolve_client(token, db)
+
+async def _resolve_client(token: str, db: crud.AnySession) -> schemas.AuthenticatedClient:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         client_id: str = payload.get("sub")
         if client_id is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-    
-    client = crud.get_client_by_id(db, client_id=client_id)
-    if client is None:
-        raise credentials_exception
-    return client
+        raise _credentials_exception()
+
+    if AUTH_STRICT_DB:
+        return await load_client(db, client_id)
+    client = client_cache.get(client_id)
+    if client is not None:
+        return client
+    tier = payload.get("tier")
+    if tier is not None:
+        return schemas.AuthenticatedClient(client_id=client_id, tier=tier)
+    # Tokens issued before tier claims existed
+    return await load_client(db, client_id)
+
+async def check_tier(current_client: schemas.AuthenticatedClient, required_tier: str, db: crud.AnySession,
+                     detail: Optional[str] = None) -> schemas.AuthenticatedClient:
+    """
+    Returns the client if it has the required tier, raising 403 otherwise. Before refusing
+    a tier taken from the token's claim, which may predate an upgrade, it is confirmed
+    against the database. A cached client was read from the database recently, and upgrades
+    invalidate its entry, so it is trusted.
+    """
+    if current_client.tier != required_tier and not AUTH_STRICT_DB:
+        cached = client_cache.get(current_client.client_id)
+        current_client = cached if cached is not None else await load_client(db, current_client.client_id)
+    if current_client.tier != required_tier:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=detail or f"This feature requires the '{required_tier}' tier."
+        )
+    return current_client
 
+@lru_cache(maxsize=None)
 def require_tier(required_tier: str):
     """
     A dependency factory that creates a dependency to check for a specific client tier.
+    Each tier gets one dependency, so FastAPI runs it once per request however many
+    other dependencies (e.g. quotas.enforce) also require it.
     """
-    def tier_checker(current_client: models.Client = Depends(get_current_client)):
-        if current_client.tier != required_tier:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail=f"This feature requires the '{required_tier}' tier."
-            )
-        return current_client
+    async def tier_checker(current_client: models.Client = Depends(get_current_client), db: crud.AnySession = Depends(database.get_async_db)):
+        return await check_tier(current_client, required_tier, db)
     return tier_checker
\ No newline at end of file
@@ -0,0 +1,64 @@
+import json
+import time
+from typing import AsyncIterator, Iterable, Iterator, List, Union
+
+from fastapi.responses import StreamingResponse
+
+# Supported values for the ?stream= query parameter
+STREAM_PATTERN = "^(ndjson|sse)$"
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+def page_records(pages: Iterable[Union[str, dict]], first_page: int = 1) -> Iterator[dict]:
+    """
+    Wraps an iterator of pages into one record per page with timing, followed by a
+    final summary record. A page is its text, or a dict of fields such as
+    {"method": ..., "text": ...}. Only the current page is held in memory.
+    """
+    started = last = time.perf_counter()
+    count = 0
+    for count, page in enumerate(pages, start=1):
+        page_number = first_page + count - 1
+        now = time.perf_counter()
+        fields = page if isinstance(page, dict) else {"text": page}
+        yield {"page": page_number, **fields, "elapsed_ms": round((now - last) * 1000, 2)}
+        last = now
+    yield {"done": True, "pages": count, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+def _event_name(record: dict) -> str:
+    if "keyword" in record:
+        return "match"
+    if "page" in record:
+        return "page"
+    if "document" in record:
+        return "document"
+    return "done" if record.get("done") else "error"
+
+def _encode(record: dict, fmt: str) -> str:
+    data = json.dumps(record)
+    if fmt == "sse":
+        return f"event: {_event_name(record)}\ndata: {data}\n\n"
+    return data + "\n"
+
+async def _encode_all(records: AsyncIterator[Union[dict, List[dict]]], fmt: str) -> AsyncIterator[str]:
+    try:
+        async for record in records:
+            # Producers may hand over a batch of records at once to save round-trips
+            if isinstance(record, list):
+                yield "".join(_encode(item, fmt) for item in record)
+            else:
+                yield _encode(record, fmt)
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        yield _encode({"error": str(e)}, fmt)
+
+def response(records: AsyncIterator[Union[dict, List[dict]]], fmt: str) -> StreamingResponse:
+    """Builds a streaming response that sends each record as soon as it is ready."""
+    return StreamingResponse(
+        _encode_all(records, fmt),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,329 @@
+import asyncio
+import base64
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import httpx
+from fastapi import HTTPException, status
+
+# --- Third-Party Detection API Settings ---
+THIRD_PARTY_API_ID = os.getenv("THIRD_PARTY_API_ID")
+THIRD_PARTY_API_SECRET = os.getenv("THIRD_PARTY_API_SECRET")
+THIRD_PARTY_API_BASE_URL = os.getenv("THIRD_PARTY_API_BASE_URL", "http://20.255.59.96:8000")
+THIRD_PARTY_CONNECT_TIMEOUT_SECONDS = float(os.getenv("THIRD_PARTY_CONNECT_TIMEOUT_SECONDS", "3"))
+THIRD_PARTY_TIMEOUT_SECONDS = float(os.getenv("THIRD_PARTY_TIMEOUT_SECONDS", "10"))
+# Retries after a connection failure, timeout or 502/503/504, with exponential backoff
+THIRD_PARTY_RETRIES = int(os.getenv("THIRD_PARTY_RETRIES", "2"))
+THIRD_PARTY_RETRY_BACKOFF_SECONDS = float(os.getenv("THIRD_PARTY_RETRY_BACKOFF_SECONDS", "0.2"))
+THIRD_PARTY_MAX_CONNECTIONS = int(os.getenv("THIRD_PARTY_MAX_CONNECTIONS", "100"))
+# The upstream token is refreshed this long before it expires
+THIRD_PARTY_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("THIRD_PARTY_TOKEN_REFRESH_MARGIN_SECONDS", "60"))
+# Used when the token response has no expires_in
+THIRD_PARTY_TOKEN_DEFAULT_TTL_SECONDS = int(os.getenv("THIRD_PARTY_TOKEN_DEFAULT_TTL_SECONDS", "300"))
+# -------------------------------------
+
+# --- Detection Batching Settings ---
+# Results are cached by the SHA-256 of the text
+DETECT_CACHE_SIZE = int(os.getenv("DETECT_CACHE_SIZE", "10000"))
+DETECT_CACHE_TTL_SECONDS = int(os.getenv("DETECT_CACHE_TTL_SECONDS", "3600"))  # 1 hour
+# Requests arriving within this window are merged; identical texts are sent once
+DETECT_BATCH_WINDOW_MS = float(os.getenv("DETECT_BATCH_WINDOW_MS", "5"))
+# Upper bound on concurrent upstream /detect calls
+DETECT_MAX_PARALLEL = int(os.getenv("DETECT_MAX_PARALLEL", "16"))
+DETECT_BATCH_MAX_TEXTS = int(os.getenv("DETECT_BATCH_MAX_TEXTS", "100"))
+# The circuit opens after this many consecutive upstream failures and stays open this long
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = int(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# -------------------------------------
+
+RETRY_STATUS_CODES = {502, 503, 504}
+
+class DetectionClient:
+    """
+    Calls the third-party detection API over a shared, connection-pooled HTTP client.
+    The upstream access token is cached and refreshed by one request at a time.
+    """
+    def __init__(self):
+        self._http: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        self.open()
+        return self._http
+
+    def open(self):
+        """Creates the pooled HTTP client if it is not open yet."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=THIRD_PARTY_API_BASE_URL,
+                timeout=httpx.Timeout(THIRD_PARTY_TIMEOUT_SECONDS, connect=THIRD_PARTY_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=THIRD_PARTY_MAX_CONNECTIONS,
+                    max_keepalive_connections=THIRD_PARTY_MAX_CONNECTIONS,
+                ),
+            )
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _post(self, path: str, **kwargs) -> httpx.Response:
+        """POSTs to the upstream API, retrying transient failures."""
+        for attempt in range(THIRD_PARTY_RETRIES + 1):
+            last_attempt = attempt == THIRD_PARTY_RETRIES
+            try:
+                response = await self.http.post(path, **kwargs)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    raise HTTPException(
+                        status_code=status.HTTP_502_BAD_GATEWAY,
+                        detail=f"Third-party API is unreachable: {e!r}"
+                    )
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    return response
+            await asyncio.sleep(THIRD_PARTY_RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    def _token_valid(self) -> bool:
+        return self._token is not None and time.monotonic() < self._token_expires_at
+
+    async def _get_token(self) -> str:
+        if self._token_valid():
+            return self._token
+        async with self._token_lock:
+            # Another request may have refreshed it while we waited
+            if self._token_valid():
+                return self._token
+            credentials = f"{THIRD_PARTY_API_ID}:{THIRD_PARTY_API_SECRET}"
+            encoded_credentials = base64.b64encode(credentials.encode()).decode()
+            response = await self._post(
+                "/oauth/token",
+                headers={"Authorization": f"Bearer {encoded_credentials}"},
+                json={"grant_type": "client_credentials"},
+            )
+            _raise_for_status(response)
+            body = response.json()
+            expires_in = body.get("expires_in") or THIRD_PARTY_TOKEN_DEFAULT_TTL_SECONDS
+            self._token = body["access_token"]
+            self._token_expires_at = time.monotonic() + max(expires_in - THIRD_PARTY_TOKEN_REFRESH_MARGIN_SECONDS, 0)
+            return self._token
+
+    def _invalidate_token(self, token: str):
+        if self._token == token:
+            self._token = None
+
+    async def detect(self, text: str) -> dict:
+        """Runs explicit-content detection on text and returns the upstream result."""
+        for _ in range(2):
+            token = await self._get_token()
+            response = await self._post(
+                "/detect",
+                headers={"Authorization": f"Bearer {token}"},
+                json={"text": text},
+            )
+            if response.status_code != status.HTTP_401_UNAUTHORIZED:
+                break
+            # The upstream revoked or expired the token early; fetch a new one and retry once
+            self._invalidate_token(token)
+        _raise_for_status(response)
+        return response.json()
+
+def _raise_for_status(response: httpx.Response):
+    if response.is_error:
+        # Forward the error from the third-party API
+        raise HTTPException(status_code=response.status_code, detail=f"Error from third-party API: {response.text}")
+
+class DetectionCache:
+    """An LRU of detection results keyed by text hash, with a TTL."""
+    def __init__(self, size: int, ttl_seconds: int):
+        self.size = size
+        self.ttl_seconds = ttl_seconds
+        self._results: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, result)
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._results[key]
+            return None
+        self._results.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: dict):
+        self._results[key] = (time.monotonic() + self.ttl_seconds, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.size:
+            self._results.popitem(last=False)
+
+class CircuitBreaker:
+    """
+    Fails fast while the upstream is degraded. After failure_threshold consecutive
+    failures the circuit opens for reset_seconds; then a single trial call decides
+    whether it closes again or stays open for another period.
+    """
+    def __init__(self, failure_threshold: int, reset_seconds: int):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def check(self):
+        """Raises 503 with Retry-After if calls are currently refused."""
+        state = self.state
+        if state == "closed" or (state == "half_open" and not self._trial_running):
+            return
+        retry_after = max(int(self.opened_at + self.reset_seconds - time.monotonic()), 1)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The third-party detection service is temporarily unavailable. Please retry later.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    def acquire(self):
+        """Like check(), but claims the trial call when the circuit is half-open."""
+        self.check()
+        if self.state == "half_open":
+            self._trial_running = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _consume_exception(future: asyncio.Future):
+    # Every waiter may have gone away; don't log the shared failure as unretrieved
+    if not future.cancelled():
+        future.exception()
+
+class DetectionBatcher:
+    """
+    Sits in front of the upstream /detect call. Cached texts are answered locally.
+    The rest are collected for DETECT_BATCH_WINDOW_MS, merged with identical texts
+    already waiting or in flight, and sent with at most DETECT_MAX_PARALLEL calls
+    at once. The upstream has no bulk endpoint, so a batch becomes parallel calls.
+    """
+    def __init__(self, client: DetectionClient, cache: DetectionCache, breaker: CircuitBreaker):
+        self.client = client
+        self.cache = cache
+        self.breaker = breaker
+        self._pending: Dict[str, Tuple[str, asyncio.Future]] = {}  # key -> (text, future)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._flush_scheduled = False
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks = set()
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(DETECT_MAX_PARALLEL)
+        return self._slots
+
+    async def detect(self, text: str) -> dict:
+        key = _text_key(text)
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+        future = self._in_flight.get(key)
+        if future is None and key in self._pending:
+            future = self._pending[key][1]
+        if future is None:
+            self.breaker.check()
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            future.add_done_callback(_consume_exception)
+            self._pending[key] = (text, future)
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                loop.call_later(DETECT_BATCH_WINDOW_MS / 1000, self._flush)
+        # A caller going away must not cancel the call other callers are waiting on
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        batch, self._pending = self._pending, {}
+        for key, (text, future) in batch.items():
+            self._in_flight[key] = future
+            task = asyncio.ensure_future(self._call(key, text, future))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _call(self, key: str, text: str, future: asyncio.Future):
+        try:
+            async with self.slots:
+                # The circuit may have opened while this call waited for a slot
+                self.breaker.acquire()
+                try:
+                    result = await self.client.detect(text)
+                except HTTPException as e:
+                    if e.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    raise
+                except Exception:
+                    self.breaker.record_failure()
+                    raise
+                self.breaker.record_success()
+            self.cache.put(key, result)
+            future.set_result(result)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._in_flight.pop(key, None)
+
+detection_client = DetectionClient()
+breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+batcher = DetectionBatcher(detection_client, DetectionCache(DETECT_CACHE_SIZE, DETECT_CACHE_TTL_SECONDS), breaker)
+
+def _check_configured():
+    if not THIRD_PARTY_API_ID or not THIRD_PARTY_API_SECRET:
+        raise HTTPException(status_code=500, detail="Third-party API credentials are not configured on the server.")
+
+async def detect(text: str) -> dict:
+    """Detects explicit content in a text through the cache, batcher and circuit breaker."""
+    _check_configured()
+    return await batcher.detect(text)
+
+async def detect_many(texts: List[str]) -> List[Union[dict, Exception]]:
+    """
+    Detects explicit content in several texts at once. Returns one result per text,
+    in order, or the exception raised for that text.
+    """
+    _check_configured()
+    breaker.check()
+    return await asyncio.gather(*(batcher.detect(text) for text in texts), return_exceptions=True)
+
+def startup():
+    """Opens the pooled upstream client. Called when the application starts."""
+    detection_client.open()
+
+async def shutdown():
+    """Closes the pooled upstream connections. Called when the application shuts down."""
+    await detection_client.close()
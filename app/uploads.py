@@ -0,0 +1,131 @@
+import io
+import mmap
+import os
+from typing import BinaryIO, Dict, Optional
+from urllib.parse import parse_qs
+
+from fastapi import status
+from fastapi.responses import JSONResponse
+
+# --- Upload Limit Settings ---
+# Allowance on top of a route's file size limit for multipart framing and form fields
+UPLOAD_OVERHEAD_BYTES = int(os.getenv("UPLOAD_OVERHEAD_BYTES", str(64 * 1024)))  # 64 KB
+# -------------------------------------
+
+class UploadTooLarge(Exception):
+    pass
+
+class UploadLimitMiddleware:
+    """
+    Rejects request bodies that are over a route's upload limit while they arrive,
+    instead of after the whole upload has been spooled to disk. Bodies whose
+    Content-Length is already over the limit are rejected before reading anything.
+    The exact per-tier check on the file itself still happens in the endpoint.
+    Routes in stream_limits accept larger bodies when the request asks for ?stream=.
+    """
+    def __init__(self, app, limits: Dict[str, int], stream_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.limits = limits
+        self.stream_limits = stream_limits or {}
+
+    def _limit(self, scope) -> Optional[int]:
+        path = scope["path"]
+        if path in self.stream_limits and parse_qs(scope.get("query_string", b"").decode("latin-1")).get("stream"):
+            return self.stream_limits[path]
+        return self.limits.get(path)
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit(scope) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        limit += UPLOAD_OVERHEAD_BYTES
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await _reject(limit, scope, receive, send)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Once the limit is hit, whatever the app makes of the aborted body is replaced by a 413
+            if exceeded:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await _reject(limit, scope, receive, send)
+
+async def _reject(limit: int, scope, receive, send):
+    response = JSONResponse(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        content={"detail": f"Request body exceeds the {limit // (1024 * 1024)}MB upload limit for this endpoint."},
+        headers={"Connection": "close"},
+    )
+    await response(scope, receive, send)
+
+class MappedUpload:
+    """
+    Read-only, zero-copy view of an uploaded file for PyMuPDF and hashing.
+    The upload is memory-mapped; a SpooledTemporaryFile still held in memory is rolled
+    over to its temporary file first. File objects without a descriptor are read into memory.
+    Close it (or use it as a context manager) before the file is closed.
+    """
+    def __init__(self, fileobj: BinaryIO):
+        self._file = fileobj
+        self._mmap: Optional[mmap.mmap] = None
+        rollover = getattr(fileobj, "rollover", None)
+        if rollover is not None:
+            rollover()
+        fileobj.seek(0)
+        try:
+            fileno = fileobj.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            self.data = memoryview(fileobj.read())
+            return
+        if os.fstat(fileno).st_size == 0:
+            self.data = memoryview(b"")
+        else:
+            self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+            self.data = memoryview(self._mmap)
+
+    def close(self):
+        """Releases the view and closes the underlying file."""
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> memoryview:
+        return self.data
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def iter_closing(iterator, upload: MappedUpload):
+    """Yields from iterator, closing the upload once it is exhausted or abandoned."""
+    try:
+        yield from iterator
+    finally:
+        upload.close()
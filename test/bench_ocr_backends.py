@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+# Allow running this script directly from the repository root or the test folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from app import ocr
+
+# --- Configuration ---
+PDF_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample_ocr.pdf")
+ROUNDS = 5
+DPI = 300
+LANG = "eng"
+# ---------------------
+
+# Compares the per-page cost of each OCR backend in a single process.
+# "blank page" time is dominated by fixed per-call overhead (process startup and
+# model loading for pytesseract); "document page" time includes actual recognition.
+
+print(f"--- OCR backend benchmark ({PDF_FILE_PATH}, {DPI} dpi, {ROUNDS} rounds) ---")
+
+options = ocr.resolve_options({"dpi": DPI, "lang": LANG})
+with fitz.open(PDF_FILE_PATH) as doc:
+    pages = [ocr.rasterize_page(doc, number, options) for number in range(1, doc.page_count + 1)]
+blank = Image.new("L", (200, 200), 255)
+
+def time_per_call(backend, images):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for image in images:
+            backend.image_to_string(image, LANG, None)
+    return (time.perf_counter() - start) / (ROUNDS * len(images)) * 1000
+
+for name in ("pytesseract", "tesserocr"):
+    try:
+        backend = ocr.create_backend(name)
+        # Warm up so one-time setup (e.g. the first model load) is not counted
+        backend.image_to_string(blank, LANG, None)
+    except Exception as e:
+        print(f"   {name:12s} unavailable: {e}")
+        continue
+    blank_ms = time_per_call(backend, [blank])
+    page_ms = time_per_call(backend, pages)
+    print(f"   {name:12s} blank page: {blank_ms:8.1f} ms   document page: {page_ms:8.1f} ms")
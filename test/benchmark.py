@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Allow running this script directly from the repository root or the test folder
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, ".."))
+sys.path.insert(0, TEST_DIR)
+
+# --- Configuration ---
+WORK_DIR = tempfile.mkdtemp(prefix="tst_api_bench_")
+DEFAULT_REQUESTS = 50
+DEFAULT_CONCURRENCY = 4
+DEFAULT_WARMUP = 3
+DEFAULT_OUTPUT_DIR = os.path.join(TEST_DIR, "benchmark_results")
+# ---------------------
+
+# Runs the API in-process through an ASGI client against a throwaway SQLite database,
+# with the detection stub from stub_third_party.py mounted in place of the real upstream.
+# Reports throughput and p50/p95/p99 latency per scenario and saves the run as JSON.
+#
+#   python test/benchmark.py                          # all scenarios
+#   python test/benchmark.py --only extract-text --requests 200 --concurrency 8
+#   python test/benchmark.py --compare test/benchmark_results/<earlier run>.json
+#
+# Quotas are disabled and the result cache is off unless --result-cache is given, so
+# repeated uploads of the same document measure the real work each time.
+
+def _configure_environment(result_cache: bool):
+    # Must run before the app is imported: settings are read at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'bench.db')}"
+    os.environ["QUOTAS_ENABLED"] = "false"
+    os.environ["AUTOMATON_CACHE_DIR"] = os.path.join(WORK_DIR, "automata")
+    if result_cache:
+        os.environ["RESULT_CACHE_DIR"] = os.path.join(WORK_DIR, "results")
+    else:
+        os.environ["RESULT_CACHE_DIR"] = ""
+        os.environ["RESULT_CACHE_MEMORY_BYTES"] = "0"
+    os.environ["THIRD_PARTY_API_BASE_URL"] = "http://detector-stub"
+    os.environ.setdefault("THIRD_PARTY_API_ID", "stub-id")
+    os.environ.setdefault("THIRD_PARTY_API_SECRET", "stub-secret")
+    os.environ["STUB_API_ID"] = os.environ["THIRD_PARTY_API_ID"]
+    os.environ["STUB_API_SECRET"] = os.environ["THIRD_PARTY_API_SECRET"]
+    os.environ.setdefault("PROFILE_DIR", os.path.join(WORK_DIR, "profiles"))
+
+# --- Scenarios ---
+# Each scenario builds the keyword arguments for one request; i is the request number,
+# used where inputs must differ per request (e.g. to get past the detection cache).
+
+def _pdf(name):
+    return lambda corpus, i: {"files": {"file": (name, corpus[name], "application/pdf")}}
+
+def _text_search(name):
+    return lambda corpus, i: {
+        "data": {"keywords": ["invoice", "payment", "liability"]},
+        "files": {"file": (name, corpus[name], "text/plain")},
+    }
+
+def _pdf_search(name, ocr_fallback=False):
+    return lambda corpus, i: {
+        "data": {"keywords": ["invoice", "payment", "liability"], "ocr_fallback": str(ocr_fallback).lower()},
+        "files": {"file": (name, corpus[name], "application/pdf")},
+    }
+
+def _batch(*names):
+    return lambda corpus, i: {"files": [("files", (name, corpus[name], "application/pdf")) for name in names]}
+
+def _detect(corpus, i):
+    return {"json": {"text": f"benchmark text number {i} with an invoice"}}
+
+def _detect_batch(corpus, i):
+    return {"json": {"texts": [f"benchmark batch {i} text {n}" for n in range(20)]}}
+
+# name -> (method, path, request builder, needs OCR)
+SCENARIOS = {
+    "extract-text/1p": ("POST", "/extract-text/", _pdf("text-1p.pdf"), False),
+    "extract-text/10p": ("POST", "/extract-text/", _pdf("text-10p.pdf"), False),
+    "extract-text/100p": ("POST", "/extract-text/", _pdf("text-100p.pdf"), False),
+    "extract-text/100p-ndjson": ("POST", "/extract-text/?stream=ndjson", _pdf("text-100p.pdf"), False),
+    "extract-text/batch-3": ("POST", "/extract-text/batch", _batch("text-10p.pdf", "text-10p.pdf", "mixed-4p.pdf"), False),
+    "extract-text-ocr/scanned-1p": ("POST", "/extract-text-ocr/", _pdf("scanned-1p.pdf"), True),
+    "extract-text-ocr/scanned-5p": ("POST", "/extract-text-ocr/", _pdf("scanned-5p.pdf"), True),
+    "extract-text-ocr/mixed-4p-hybrid": ("POST", "/extract-text-ocr/?mode=hybrid", _pdf("mixed-4p.pdf"), True),
+    "search-text/100kb": ("POST", "/search-text/", _text_search("text-100kb.txt"), False),
+    "search-text/1mb": ("POST", "/search-text/", _text_search("text-1mb.txt"), False),
+    "search-text/1mb-ndjson": ("POST", "/search-text/?stream=ndjson", _text_search("text-1mb.txt"), False),
+    "search-pdf/10p": ("POST", "/search-pdf/", _pdf_search("text-10p.pdf"), False),
+    "search-pdf/mixed-4p-ocr": ("POST", "/search-pdf/", _pdf_search("mixed-4p.pdf", ocr_fallback=True), True),
+    "detect-explicit": ("POST", "/detect-explicit", _detect, False),
+    "detect-explicit/batch-20": ("POST", "/detect-explicit/batch", _detect_batch, False),
+}
+
+# --- Measurement ---
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+def summarize(latencies, statuses, wall_seconds):
+    latencies = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "statuses": statuses,
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(latencies[-1]) if latencies else None,
+    }
+
+async def run_scenario(client, headers, corpus, scenario, requests, concurrency, warmup):
+    method, path, build, _ = scenario
+
+    async def one(i):
+        start = time.perf_counter()
+        # Read the whole body so streamed responses are timed to their last byte
+        response = await client.request(method, path, headers=headers, **build(corpus, i))
+        await response.aread()
+        return time.perf_counter() - start, str(response.status_code)
+
+    for i in range(warmup):
+        await one(-1 - i)
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def limited(i):
+        async with slots:
+            return await one(i)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(limited(i) for i in range(requests)))
+    wall_seconds = time.perf_counter() - start
+    statuses = {}
+    for _, status_code in results:
+        statuses[status_code] = statuses.get(status_code, 0) + 1
+    return summarize([latency for latency, _ in results], statuses, wall_seconds)
+
+def ocr_available():
+    from PIL import Image
+    from app import ocr
+    try:
+        ocr.get_backend().image_to_string(Image.new("L", (50, 50), 255), "eng", None)
+        return True
+    except Exception:
+        return False
+
+async def register(client, exclusive):
+    name = f"bench-{time.time_ns()}"
+    response = await client.post("/register-client", json={"client_name": name, "email": f"{name}@example.com", "redirect_uri": "http://localhost"})
+    response.raise_for_status()
+    credentials = response.json()
+    response = await client.post("/oauth/token", json={
+        "grant_type": "client_credentials",
+        "client_id": credentials["client_id"],
+        "client_secret": credentials["client_secret"],
+    })
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    if exclusive:
+        response = await client.post("/upgrade-to-exclusive", headers=headers)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return headers
+
+async def run(args):
+    import httpx
+    import stub_third_party
+    import synthetic_corpus
+    from app import third_party
+    from app.main import app
+
+    print("--- Building synthetic corpus ---")
+    corpus = {name: build() for name, build in synthetic_corpus.CORPUS.items()}
+
+    selected = {name: scenario for name, scenario in SCENARIOS.items() if not args.only or any(name.startswith(prefix) for prefix in args.only)}
+    if any(needs_ocr for *_, needs_ocr in selected.values()) and not ocr_available():
+        print("   No working OCR backend (is tesseract installed?); skipping OCR scenarios")
+        selected = {name: scenario for name, scenario in selected.items() if not scenario[3]}
+
+    # The upstream client talks to the stub app in-process instead of over the network
+    third_party.detection_client._http = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=stub_third_party.app), base_url=third_party.THIRD_PARTY_API_BASE_URL
+    )
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            headers = await register(client, exclusive=True)
+            print(f"--- Running {len(selected)} scenarios: {args.requests} requests, concurrency {args.concurrency} ---")
+            for name, scenario in selected.items():
+                result = await run_scenario(client, headers, corpus, scenario, args.requests, args.concurrency, args.warmup)
+                results[name] = result
+                print(
+                    f"   {name:34s} {result['throughput_rps'] or 0:8.1f} req/s   p50 {result['p50_ms']:9.1f} ms"
+                    f"   p95 {result['p95_ms']:9.1f} ms   p99 {result['p99_ms']:9.1f} ms   errors {result['errors']}"
+                )
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=TEST_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"--- Compared with {baseline_path} (negative latency change is faster) ---")
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get("p50_ms") or not result.get("p50_ms"):
+            continue
+        change = lambda key: (result[key] - before[key]) / before[key] * 100
+        print(
+            f"   {name:34s} throughput {result['throughput_rps'] - before['throughput_rps']:+8.1f} req/s"
+            f"   p50 {change('p50_ms'):+6.1f}%   p95 {change('p95_ms'):+6.1f}%   p99 {change('p99_ms'):+6.1f}%"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load benchmark for the API.")
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="Untimed requests before each scenario")
+    parser.add_argument("--only", nargs="*", help="Run only scenarios whose names start with these prefixes")
+    parser.add_argument("--result-cache", action="store_true", help="Leave the result cache on")
+    parser.add_argument("--output", help="Where to save the JSON results (default: a timestamped file)")
+    parser.add_argument("--compare", help="An earlier results file to compare against")
+    args = parser.parse_args()
+
+    _configure_environment(args.result_cache)
+    results = asyncio.run(run(args))
+
+    started_at = datetime.now(timezone.utc)
+    report = {
+        "created_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "requests": args.requests, "concurrency": args.concurrency,
+            "warmup": args.warmup, "result_cache": args.result_cache,
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"--- Results saved to {output} ---")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
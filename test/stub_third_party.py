@@ -0,0 +1,61 @@
+import asyncio
+import base64
+import os
+import secrets
+import time
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException
+from pydantic import BaseModel
+
+# --- Configuration ---
+# Point the API at this stub with THIRD_PARTY_API_BASE_URL=http://localhost:9000
+# and THIRD_PARTY_API_ID / THIRD_PARTY_API_SECRET set to the values below.
+STUB_API_ID = os.getenv("STUB_API_ID", "stub-id")
+STUB_API_SECRET = os.getenv("STUB_API_SECRET", "stub-secret")
+STUB_TOKEN_TTL_SECONDS = int(os.getenv("STUB_TOKEN_TTL_SECONDS", "3600"))
+STUB_LATENCY_MS = int(os.getenv("STUB_LATENCY_MS", "0"))  # Added to every /detect call
+STUB_PORT = int(os.getenv("STUB_PORT", "9000"))
+# ---------------------
+
+# A stand-in for the third-party explicit-content detection service, for local
+# testing and benchmarks. Run it with: python test/stub_third_party.py
+
+EXPLICIT_WORDS = {"fuck", "shit", "bitch", "cunt", "dick"}
+
+app = FastAPI(title="Detection API stub")
+tokens = {}  # token -> expires_at
+counters = {"token_requests": 0, "detect_requests": 0}
+
+class DetectRequest(BaseModel):
+    text: str
+
+@app.post("/oauth/token")
+def issue_token(authorization: str = Header("")):
+    counters["token_requests"] += 1
+    expected = base64.b64encode(f"{STUB_API_ID}:{STUB_API_SECRET}".encode()).decode()
+    if authorization != f"Bearer {expected}":
+        raise HTTPException(status_code=401, detail="Invalid API credentials")
+    token = secrets.token_urlsafe(24)
+    tokens[token] = time.time() + STUB_TOKEN_TTL_SECONDS
+    return {"access_token": token, "token_type": "bearer", "expires_in": STUB_TOKEN_TTL_SECONDS}
+
+@app.post("/detect")
+async def detect(data: DetectRequest, authorization: str = Header("")):
+    counters["detect_requests"] += 1
+    token = authorization.removeprefix("Bearer ")
+    if tokens.get(token, 0) < time.time():
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    if STUB_LATENCY_MS:
+        await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    words = [word.strip(".,!?").lower() for word in data.text.split()]
+    hits = [word for word in words if word in EXPLICIT_WORDS]
+    score = round(len(hits) / len(words), 3) if words else 0.0
+    return {"explicit": bool(hits), "score": score, "matches": sorted(set(hits))}
+
+@app.get("/stats")
+def stats():
+    return counters
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=STUB_PORT)
@@ -0,0 +1,103 @@
+import io
+import os
+import random
+import sys
+
+from PIL import Image, ImageDraw, ImageFont
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+# --- Configuration ---
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+SCAN_DPI = 150  # Resolution of the page images in scanned PDFs
+# ---------------------
+
+# Generates deterministic synthetic documents for benchmarks: PDFs with a text layer,
+# "scanned" PDFs that only contain page images, mixed PDFs alternating the two, and
+# plain text files. The same arguments always produce byte-identical files.
+# Run it directly to write a sample corpus: python test/synthetic_corpus.py [output_dir]
+
+WORDS = (
+    "invoice contract payment delivery account policy report summary balance customer "
+    "service agreement schedule amount total review signature period document section "
+    "clause notice company address reference number date terms conditions liability "
+    "insurance warranty shipment order quantity price tax discount approval manager"
+).split()
+
+def _lines(rng: random.Random, count: int, words_per_line: int = 12):
+    for _ in range(count):
+        yield " ".join(rng.choice(WORDS) for _ in range(words_per_line))
+
+def _draw_text_page(pdf: canvas.Canvas, rng: random.Random, lines_per_page: int):
+    width, height = letter
+    text = pdf.beginText(54, height - 72)
+    text.setFont("Helvetica", 10)
+    for line in _lines(rng, lines_per_page):
+        text.textLine(line)
+    pdf.drawText(text)
+
+def _draw_scanned_page(pdf: canvas.Canvas, rng: random.Random, lines_per_page: int):
+    width, height = letter
+    image = Image.new("L", (int(width / 72 * SCAN_DPI), int(height / 72 * SCAN_DPI)), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=SCAN_DPI // 6)
+    line_height = SCAN_DPI // 4
+    for number, line in enumerate(_lines(rng, lines_per_page)):
+        draw.text((SCAN_DPI * 3 // 4, SCAN_DPI + number * line_height), line, fill=0, font=font)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    buffer.seek(0)
+    pdf.drawImage(ImageReader(buffer), 0, 0, width=width, height=height)
+
+def build_pdf(kind: str, pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """
+    Builds a PDF of the given kind: "text" (text layer only), "scanned" (page images
+    only) or "mixed" (odd pages text, even pages scanned).
+    """
+    rng = random.Random(f"{kind}-{pages}-{lines_per_page}-{seed}")
+    buffer = io.BytesIO()
+    # invariant drops the creation date and random document ID so output is reproducible
+    pdf = canvas.Canvas(buffer, pagesize=letter, invariant=1)
+    for number in range(pages):
+        scanned = kind == "scanned" or (kind == "mixed" and number % 2 == 1)
+        if scanned:
+            _draw_scanned_page(pdf, rng, lines_per_page)
+        else:
+            _draw_text_page(pdf, rng, lines_per_page)
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+def build_text(size_bytes: int, seed: int = 0) -> bytes:
+    """Builds a UTF-8 text file of about size_bytes for the text search endpoints."""
+    rng = random.Random(f"text-{size_bytes}-{seed}")
+    chunks, total = [], 0
+    for line in _lines(rng, size_bytes):
+        chunks.append(line + "\n")
+        total += len(chunks[-1])
+        if total >= size_bytes:
+            break
+    return "".join(chunks).encode("utf-8")
+
+# Name -> builder for the documents the benchmarks use
+CORPUS = {
+    "text-1p.pdf": lambda: build_pdf("text", 1),
+    "text-10p.pdf": lambda: build_pdf("text", 10),
+    "text-100p.pdf": lambda: build_pdf("text", 100),
+    "scanned-1p.pdf": lambda: build_pdf("scanned", 1),
+    "scanned-5p.pdf": lambda: build_pdf("scanned", 5),
+    "mixed-4p.pdf": lambda: build_pdf("mixed", 4),
+    "text-100kb.txt": lambda: build_text(100 * 1024),
+    "text-1mb.txt": lambda: build_text(1024 * 1024),
+}
+
+if __name__ == "__main__":
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"--- Writing synthetic corpus to {output_dir} ---")
+    for name, build in CORPUS.items():
+        data = build()
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(data)
+        print(f"   {name:16s} {len(data) / 1024:10.1f} KB")
@@ -0,0 +1,53 @@
+import io
+import os
+import sys
+
+import pytest
+
+# Allow running from the repository root or the test folder: python -m pytest test/
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIR, ".."))
+
+from app import automata, search
+
+# The chunked scanner must report exactly what a single scan of the whole text reports,
+# whatever the chunk size: matches straddling a chunk boundary, UTF-8 characters split
+# across chunks, and whole-word checks next to a boundary.
+
+CASES = {
+    "overlapping": ("abcabcabcab cabc", ["abc", "bca", "cab", "abcabc", "c"]),
+    "multibyte": ("héllo wörld 日本語 ünïcödé wörld日本", ["wörld", "日本", "本語", "ünï", "é", "d日"]),
+    "emoji": ("a😀b😀😀c 😀", ["😀", "😀😀", "b😀", "c 😀"]),
+    "words": ("he hello she he_ he, the he xhello hellox", ["he", "hello", "she"]),
+    "case": ("İnvoice INVOICE invoice Straße STRASSE", ["Invoice", "invoice", "straße", "İnvoice"]),
+}
+
+def _whole_scan(A, text: str, case_insensitive: bool, whole_word: bool):
+    scanned = automata.fold_case(text) if case_insensitive else text
+    return sorted((keyword, start, end, None) for keyword, start, end in search._scan(A, text, scanned, whole_word))
+
+def _chunked_scan(A, text: str, case_insensitive: bool, whole_word: bool, chunk_bytes: int):
+    fileobj = io.BytesIO(text.encode("utf-8"))
+    chunks = search.iter_match_chunks(A, fileobj, case_insensitive, whole_word, chunk_bytes=chunk_bytes)
+    return sorted(match for matches in chunks for match in matches)
+
+@pytest.mark.parametrize("name", sorted(CASES))
+@pytest.mark.parametrize("case_insensitive", [False, True])
+@pytest.mark.parametrize("whole_word", [False, True])
+def test_chunked_scan_matches_whole_text(name, case_insensitive, whole_word):
+    text, keywords = CASES[name]
+    A = automata.build_automaton(keywords, case_insensitive)
+    expected = _whole_scan(A, text, case_insensitive, whole_word)
+    # Every chunk size up to past the end of the text, so each boundary position is hit
+    for chunk_bytes in range(1, len(text.encode("utf-8")) + 2):
+        assert _chunked_scan(A, text, case_insensitive, whole_word, chunk_bytes) == expected, chunk_bytes
+
+def test_case_insensitive_reports_keywords_differing_only_in_case():
+    A = automata.build_automaton(["Invoice", "invoice"], case_insensitive=True)
+    found = search.find_all(A, io.BytesIO(b"INVOICE"), "count", case_insensitive=True)
+    assert found == {"counts": {"Invoice": 1, "invoice": 1}, "total": 2}
+
+def test_invalid_utf8_raises():
+    A = automata.build_automaton(["a"])
+    with pytest.raises(UnicodeDecodeError):
+        list(search.iter_match_chunks(A, io.BytesIO(b"a\xff\xfea"), chunk_bytes=2))